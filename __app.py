@@ -1,15 +1,65 @@
 # bank_app_full.py
 import random
 import time
+from functools import lru_cache
 import tkinter as tk
 from tkinter import messagebox
+from keystore import KeyStore
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# texts at least this long go through the numpy path when numpy is installed
+VECTOR_MIN_LEN = 256
+KEYSTORE_FILE = "keystore.bin"
+# how many distinct keys keep their compiled rotor tables around
+COMPILED_CACHE_SIZE = 1024
 
 # ---------------- Encryption ----------------
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def _compile_tables(alphabet, rotor1, rotor2, reflector, plugboard):
+    # turn the rotor lists into index tables so every step is O(1):
+    # plug[i]   = alphabet index after the plugboard
+    # r1[i]     = alphabet index of rotor1[i], r1_inv is its inverse (rotor1.index)
+    # r2, r2_inv the same for rotor2, ref[i] = alphabet index of reflector[i]
+    # the tables are shared by every key with these contents: don't modify them
+    pos = {c: i for i, c in enumerate(alphabet)}
+    swap = dict(plugboard)
+    plug = [pos[swap.get(c, c)] for c in alphabet]
+    r1 = [pos[c] for c in rotor1]
+    r2 = [pos[c] for c in rotor2]
+    ref = [pos[c] for c in reflector]
+    compiled = {"plug": plug, "r1": r1, "r1_inv": _invert(r1), "r2": r2, "r2_inv": _invert(r2), "ref": ref}
+    # the reflector is a plain shuffle, so the cipher is not its own inverse:
+    # running the same steps with plug and ref inverted undoes it
+    inverse = dict(compiled, plug=_invert(plug), ref=_invert(ref))
+    if np is not None:
+        for tables in (compiled, inverse):
+            tables["np"] = {name: np.array(table, dtype=np.int64) for name, table in tables.items()}
+    compiled["inverse"] = inverse
+    return compiled
+
+
+def _invert(table):
+    inv = [0] * len(table)
+    for i, v in enumerate(table):
+        inv[v] = i
+    return inv
+
+
 class MultiAccountEncrypt:
-    def __init__(self):
+    def __init__(self, keystore=None):
         self.alphabet = [chr(i) for i in range(65, 91)] + [",", ".", "!", "/", "?", "#", "$", "%", "^", "&", "*", "(", ")", "-", "_", "=", "+"]
         self.n = len(self.alphabet)
         self.accounts = {}
+        self.pos = {c: i for i, c in enumerate(self.alphabet)}
+        # optional KeyStore so keys survive a restart; read lazily per account
+        self.keystore = keystore
+        # (key, copies of its rotors, reflector and plugboard, tables) of the
+        # last key compiled, so encrypt_char does not rebuild them per character
+        self._last_compiled = None
 
     def generate_key(self):
         rotor1 = self.alphabet.copy()
@@ -28,28 +78,143 @@ class MultiAccountEncrypt:
             "rotor2_offset": 0
         }
 
+    def compile_key(self, key):
+        # the same key as last time, unchanged: comparing the lists is done in C
+        # and is much cheaper than building the lookup key below
+        last = self._last_compiled
+        if (last is not None and last[0] is key and last[1] == key["rotor1"] and last[2] == key["rotor2"]
+                and last[3] == key["reflector"] and last[4] == key["plugboard"]):
+            return last[5]
+        # tables are cached by the rotor contents, so an edited or new key dict
+        # never picks up tables compiled for another one
+        compiled = _compile_tables(tuple(self.alphabet), tuple(key["rotor1"]), tuple(key["rotor2"]),
+                                   tuple(key["reflector"]), tuple(sorted(key["plugboard"].items())))
+        self._last_compiled = (key, list(key["rotor1"]), list(key["rotor2"]), list(key["reflector"]),
+                               dict(key["plugboard"]), compiled)
+        return compiled
+
+    def key_from_compiled(self, compiled):
+        # rebuild the key dict from stored tables
+        a = self.alphabet
+        key = {
+            "rotor1": [a[i] for i in compiled["r1"]],
+            "rotor2": [a[i] for i in compiled["r2"]],
+            "reflector": [a[i] for i in compiled["ref"]],
+            "plugboard": {a[i]: a[j] for i, j in enumerate(compiled["plug"]) if i != j},
+            "rotor1_offset": 0,
+            "rotor2_offset": 0
+        }
+        return key
+
+    def get_key(self, account_name):
+        # key from memory, or from the keystore on first use after a restart
+        entry = self.accounts.get(account_name)
+        if entry and entry["key"] is not None:
+            return entry["key"]
+        if self.keystore is None:
+            return None
+        compiled = self.keystore.get(account_name)
+        if compiled is None:
+            return None
+        key = self.key_from_compiled(compiled)
+        if entry:
+            entry["key"] = key
+        else:
+            self.accounts[account_name] = {"key": key, "data": None, "encrypted": None}
+        return key
+
+    def _step(self, a, o1, o2, ck):
+        # one character (as alphabet index) through plugboard, rotors, reflector and back
+        n = self.n
+        a = ck["plug"][a]
+        b = ck["r1"][(a + o1) % n]
+        c = ck["r2"][(b + o2) % n]
+        z = ck["ref"][c]
+        w = (ck["r2_inv"][z] - o2) % n
+        return ck["plug"][(ck["r1_inv"][w] - o1) % n]
+
     def encrypt_char(self, char, key):
-        if char not in self.alphabet:
+        a = self.pos.get(char)
+        if a is None:
             return char
-        char = key["plugboard"].get(char, char)
-        idx = (self.alphabet.index(char) + key["rotor1_offset"]) % self.n
-        char = key["rotor1"][idx]
-        idx = (self.alphabet.index(char) + key["rotor2_offset"]) % self.n
-        char = key["rotor2"][idx]
-        idx = self.alphabet.index(char)
-        char = key["reflector"][idx]
-        idx = key["rotor2"].index(char)
-        char = self.alphabet[(idx - key["rotor2_offset"]) % self.n]
-        idx = key["rotor1"].index(char)
-        char = self.alphabet[(idx - key["rotor1_offset"]) % self.n]
-        char = key["plugboard"].get(char, char)
+        ck = self.compile_key(key)
+        char = self.alphabet[self._step(a, key["rotor1_offset"], key["rotor2_offset"], ck)]
         key["rotor1_offset"] = (key["rotor1_offset"] + 1) % self.n
         if key["rotor1_offset"] == 0:
             key["rotor2_offset"] = (key["rotor2_offset"] + 1) % self.n
         return char
 
+    def _encrypt_text_py(self, text, key, ck):
+        n = self.n
+        pos = self.pos
+        alphabet = self.alphabet
+        plug, r1, r1_inv, r2, r2_inv, ref = ck["plug"], ck["r1"], ck["r1_inv"], ck["r2"], ck["r2_inv"], ck["ref"]
+        o1 = key["rotor1_offset"] % n
+        o2 = key["rotor2_offset"] % n
+        out = []
+        for ch in text:
+            a = pos.get(ch)
+            if a is None:
+                out.append(ch)
+                continue
+            a = plug[a]
+            c = r2[(r1[(a + o1) % n] + o2) % n]
+            w = (r2_inv[ref[c]] - o2) % n
+            out.append(alphabet[plug[(r1_inv[w] - o1) % n]])
+            o1 += 1
+            if o1 == n:
+                o1 = 0
+                o2 = (o2 + 1) % n
+        key["rotor1_offset"] = o1
+        key["rotor2_offset"] = o2
+        return ''.join(out)
+
+    def _encrypt_text_np(self, text, key, ck):
+        # same maths as _encrypt_text_py, but the offsets of every position are
+        # worked out at once: the j-th alphabet character sees
+        #   rotor1 offset (o1 + j) % n and rotor2 offset (o2 + (o1 + j) // n) % n
+        n = self.n
+        t = ck["np"]
+        o1 = key["rotor1_offset"] % n
+        o2 = key["rotor2_offset"] % n
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        lookup = np.full(128, -1, dtype=np.int64)
+        lookup[[ord(c) for c in self.alphabet]] = np.arange(n)
+        idx = np.full(codes.shape, -1, dtype=np.int64)
+        ascii_mask = codes < 128
+        idx[ascii_mask] = lookup[codes[ascii_mask]]
+        mask = idx >= 0
+        m = int(mask.sum())
+        steps = o1 + np.arange(m, dtype=np.int64)
+        off1 = steps % n
+        off2 = (o2 + steps // n) % n
+        a = t["plug"][idx[mask]]
+        c = t["r2"][(t["r1"][(a + off1) % n] + off2) % n]
+        w = (t["r2_inv"][t["ref"][c]] - off2) % n
+        res = t["plug"][(t["r1_inv"][w] - off1) % n]
+        alphabet_codes = np.array([ord(c) for c in self.alphabet], dtype=np.uint32)
+        out = codes.copy()
+        out[mask] = alphabet_codes[res]
+        total = o1 + m
+        key["rotor1_offset"] = total % n
+        key["rotor2_offset"] = (o2 + total // n) % n
+        return out.tobytes().decode("utf-32-le")
+
     def encrypt_text(self, text, key):
-        return ''.join(self.encrypt_char(c, key) for c in text)
+        return self._run_text(text, key, self.compile_key(key))
+
+    def decrypt_text(self, text, key):
+        # undoes encrypt_text when key starts at the same rotor offsets
+        return self._run_text(text, key, self.compile_key(key)["inverse"])
+
+    def _run_text(self, text, key, ck):
+        if np is not None and len(text) >= VECTOR_MIN_LEN:
+            try:
+                return self._encrypt_text_np(text, key, ck)
+            except UnicodeEncodeError:
+                # lone surrogates have no UTF-32 form; the loop passes them through
+                pass
+        return self._encrypt_text_py(text, key, ck)
 
     def add_account(self, account_name, plain_text):
         if account_name in self.accounts:
@@ -59,12 +224,14 @@ class MultiAccountEncrypt:
         key["rotor2_offset"] = 0
         encrypted = self.encrypt_text(plain_text, key)
         self.accounts[account_name] = {"key": key, "data": plain_text, "encrypted": encrypted}
+        if self.keystore is not None:
+            self.keystore.put(account_name, self.compile_key(key))
         return encrypted
 
     def update_account(self, account_name, plain_text):
-        if account_name not in self.accounts:
+        key = self.get_key(account_name)
+        if key is None:
             raise ValueError("no such account")
-        key = self.accounts[account_name]["key"]
         key["rotor1_offset"] = 0
         key["rotor2_offset"] = 0
         encrypted = self.encrypt_text(plain_text, key)
@@ -73,8 +240,8 @@ class MultiAccountEncrypt:
         return encrypted
 
     def load_account_cipher(self, account_name, encrypted_text):
-        if account_name in self.accounts:
-            key = self.accounts[account_name]["key"]
+        key = self.get_key(account_name)
+        if key is not None:
             key["rotor1_offset"] = 0
             key["rotor2_offset"] = 0
             plain = self.encrypt_text(encrypted_text, key)
@@ -117,8 +284,8 @@ class Data:
         name, encrypted=line.split(":",1)
         if name != self.username:
             return False
-        if self.username in self.manager.accounts:
-            key = self.manager.accounts[self.username]["key"]
+        key = self.manager.get_key(self.username)
+        if key is not None:
             key["rotor1_offset"]=0
             key["rotor2_offset"]=0
             plain=self.manager.encrypt_text(encrypted,key)
@@ -133,7 +300,7 @@ class Data:
         if not self.manager or not self.username:
             return False
         plain=self._compose_plaintext()
-        if self.username not in self.manager.accounts:
+        if self.manager.get_key(self.username) is None:
             encrypted=self.manager.add_account(self.username,plain)
         else:
             encrypted=self.manager.update_account(self.username,plain)
@@ -399,7 +566,7 @@ class BankApp:
 
 # ---------------- Main ----------------
 if __name__=="__main__":
-    manager=MultiAccountEncrypt()
+    manager=MultiAccountEncrypt(keystore=KeyStore(KEYSTORE_FILE))
     root=tk.Tk()
     app=BankApp(root,manager)
     root.mainloop()
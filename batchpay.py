@@ -0,0 +1,237 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Apply a file of payments (payroll-style batches) in bulk.
+         Rows are (from, to, amount, note) in CSV (with or without a header
+         row) or JSON lines. They are read as a stream in windows; inside a
+         window, rows that share an account are joined into one group
+         (union-find), and the groups, which touch disjoint sets of
+         accounts, are applied in parallel by a process pool. Rows of one
+         group keep their file order, and windows are applied one after the
+         other, so every account sees its payments in file order. Each
+         payment is one TransferEngine transfer (locked, all-or-nothing).
+
+         python batchpay.py payments.csv [--results results.csv] [--workers 4]
+                            [--window 5000] [--backend file|sqlite] [--db accounts.db]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+FIELDS = ("from", "to", "amount", "note")
+RESULT_FIELDS = ("row", "from", "to", "amount", "status", "message")
+DEFAULT_WINDOW = 5000
+
+# per-process state for pool workers
+_engine = None
+_engine_spec = None
+
+
+def _get_engine(spec):
+    """A TransferEngine for the backend spec, one per process."""
+    global _engine, _engine_spec
+    if _engine is None or _engine_spec != spec:
+        # imported here so the parent only needs them when running in-process
+        from storage import FileBackend, SQLiteBackend
+        from transfer import TransferEngine
+        kind, target = spec
+        store = SQLiteBackend(target) if kind == "sqlite" else FileBackend(target)
+        _engine = TransferEngine(store=store)
+        _engine_spec = spec
+    return _engine
+
+
+def iter_rows(path):
+    """Yield (row number, dict with FIELDS) from a CSV or JSONL payment file."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".json", ".ndjson")):
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if not isinstance(record, dict):
+                    yield number, {"error": "not a JSON object"}
+                    continue
+                yield number, {k: record.get(k, "") for k in FIELDS}
+            return
+        reader = csv.reader(f)
+        for number, values in enumerate(reader, 1):
+            if not values or not any(v.strip() for v in values):
+                continue
+            if number == 1 and [v.strip().lower() for v in values[:2]] == ["from", "to"]:
+                continue
+            values = values + [""] * (len(FIELDS) - len(values))
+            yield number, dict(zip(FIELDS, values))
+
+
+def validate(record):
+    """
+    Return (payment tuple (from, to, amount, note), None) or (None, error message).
+    Uses the checks Data itself applies, so a row is rejected here rather than
+    half-way through its group.
+    """
+    from data import parse_amount, valid_note, valid_username
+    if "error" in record:
+        return None, record["error"]
+    sender = str(record.get("from", "")).strip()
+    target = str(record.get("to", "")).strip()
+    note = str(record.get("note", "") or "").strip()
+    if not sender or not target:
+        return None, "from and to are required"
+    for name in (sender, target):
+        if not valid_username(name):
+            return None, f"username {name!r} contains a separator (',' ';' or a line break)"
+    if not valid_note(note):
+        return None, "note contains a separator (';' or a line break)"
+    if sender == target:
+        return None, "from and to are the same account"
+    amount = parse_amount(record.get("amount", ""))
+    if amount is None:
+        return None, "amount must be a number greater than zero"
+    return (sender, target, amount, note), None
+
+
+def group_rows(rows):
+    """
+    Split [(row, (from, to, amount, note))] into groups whose account sets
+    do not overlap; each group keeps the rows' order.
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for _, (sender, target, _, _) in rows:
+        parent.setdefault(sender, sender)
+        parent.setdefault(target, target)
+        a, b = find(sender), find(target)
+        if a != b:
+            parent[b] = a
+    groups = {}
+    for row in rows:
+        groups.setdefault(find(row[1][0]), []).append(row)
+    return list(groups.values())
+
+
+def pack_groups(groups, buckets):
+    """Spread groups over at most `buckets` lists with similar row counts (largest first)."""
+    bins = [[] for _ in range(max(1, min(buckets, len(groups))))]
+    sizes = [0] * len(bins)
+    for group in sorted(groups, key=len, reverse=True):
+        i = sizes.index(min(sizes))
+        bins[i].append(group)
+        sizes[i] += len(group)
+    return [b for b in bins if b]
+
+
+def apply_groups(spec, groups):
+    """Run the payments of some disjoint groups in order. Returns [(row, status, message)]."""
+    from cache import get_cache
+    engine = _get_engine(spec)
+    # other processes may have written these accounts in an earlier window
+    get_cache().clear()
+    results = []
+    for group in groups:
+        for row, (sender, target, amount, note) in group:
+            try:
+                ok, message = engine.transfer(sender, target, amount, note=note,
+                                              note_target=f"Received from {sender}" + (f" - {note}" if note else ""))
+            except Exception as e:
+                ok, message = False, str(e)
+            results.append((row, "ok" if ok else "failed", message))
+    return results
+
+
+def _apply_task(args):
+    return apply_groups(*args)
+
+
+def run_batch(path, spec=("file", "encrypted_{username}.txt"), workers=None, window=DEFAULT_WINDOW, on_result=None):
+    """
+    Apply every payment in path. on_result(row, record, status, message) is
+    called for each row in file order. Returns a dict of status counts.
+    """
+    counts = {}
+    workers = workers or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def flush(window_rows):
+        records = {}
+        payments = []
+        statuses = {}
+        for row, record in window_rows:
+            records[row] = record
+            payment, error = validate(record)
+            if payment is None:
+                statuses[row] = ("invalid", error)
+            else:
+                payments.append((row, payment))
+        groups = group_rows(payments)
+        tasks = [(spec, bucket) for bucket in pack_groups(groups, workers * 4)]
+        if pool is not None and len(tasks) > 1:
+            batches = pool.map(_apply_task, tasks)
+        else:
+            batches = map(_apply_task, tasks)
+        for batch in batches:
+            for row, status, message in batch:
+                statuses[row] = (status, message)
+        for row, _ in window_rows:
+            status, message = statuses[row]
+            counts[status] = counts.get(status, 0) + 1
+            if on_result:
+                on_result(row, records[row], status, message)
+
+    try:
+        pending = []
+        for row, record in iter_rows(path):
+            pending.append((row, record))
+            if len(pending) >= window:
+                flush(pending)
+                pending = []
+        if pending:
+            flush(pending)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a CSV/JSONL file of payments.")
+    parser.add_argument("payments", help="CSV (from,to,amount,note) or JSONL file")
+    parser.add_argument("--results", help="per-row results CSV (default: <payments>.results.csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="rows scheduled together")
+    parser.add_argument("--backend", choices=("file", "sqlite"), default="file")
+    parser.add_argument("--db", default="accounts.db", help="database for --backend sqlite")
+    args = parser.parse_args(argv)
+
+    spec = ("sqlite", args.db) if args.backend == "sqlite" else ("file", "encrypted_{username}.txt")
+    results_path = args.results or args.payments + ".results.csv"
+    with open(results_path, "w", encoding="utf-8", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(RESULT_FIELDS)
+
+        def record(row, rec, status, message):
+            writer.writerow([row, rec.get("from", ""), rec.get("to", ""), rec.get("amount", ""), status, message])
+
+        counts = run_batch(args.payments, spec, args.workers, max(1, args.window), on_result=record)
+    print(", ".join(f"{k}: {v}" for k, v in sorted(counts.items())) or "no rows")
+    print(f"results -> {results_path}")
+    return 0 if not counts.get("failed") and not counts.get("invalid") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Micro-benchmarks for the cipher and persistence hot paths.
+         Builds synthetic accounts, times each path with warmup and repeats,
+         prints throughput and percentiles and can write/compare JSON results.
+
+         python bench.py                              run everything
+         python bench.py -b encrypt -b pull_data      run some benchmarks
+         python bench.py --history 5000 --note-size 40 --repeat 50
+         python bench.py --backend sqlite -b save_data -b pull_data
+         python bench.py --json out.json              save results
+         python bench.py --baseline out.json          flag regressions (exit 1)
+         python bench.py -b group_commit_0ms -b group_commit_5ms --writers 32
+         python bench.py -b transfer_stress --accounts 8 --writers 16 --backend sqlite
+         python bench.py -b update_unchecked -b update_checked --accounts 2 --writers 8
+         python bench.py -b pull_random --population 20000 --backend sharded
+         python bench.py -b report --population 20000 --report-workers 4
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from commit import CommitCoordinator
+from data import Data, update_account
+from encrypt import Encrypt
+from ledger import Ledger, OP_DEPOSIT
+from report import run_report
+from shards import SHARDED_TEMPLATE
+from storage import FileBackend, MemoryBackend, SQLiteBackend
+from transfer import TransferEngine
+
+try:
+    import __app as app
+except ImportError:
+    # __app needs tkinter; without it the rotor benchmark is skipped
+    app = None
+
+# name -> setup(args) returning (op, units, unit_name) or (op, units, unit_name, counts);
+# op() runs once per sample and may add to the counts dict, which is reported summed over the samples
+BENCHMARKS = {}
+
+
+def bench(name):
+    """Register a benchmark setup function under name."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def make_history(length, note_size, rng):
+    """Synthetic transaction strings in the same shape data.Data writes."""
+    kinds = ("Deposited", "Withdrew", "Transferred")
+    history = []
+    for i in range(length):
+        kind = kinds[i % 3]
+        amount = rng.randint(1, 100000) / 100
+        entry = f"{kind} {amount:.2f}"
+        if kind == "Transferred":
+            entry += f" to user{rng.randint(0, 999)}"
+        if note_size:
+            entry += " - " + "".join(rng.choice("abcdefghij klmnop") for _ in range(note_size))
+        history.append(entry)
+    return history
+
+
+# --backend choices -> factory(workdir)
+BACKENDS = {
+    "file": lambda workdir: FileBackend(),
+    "memory": lambda workdir: MemoryBackend(),
+    "sqlite": lambda workdir: SQLiteBackend(os.path.join(workdir, "bench.db")),
+    "sharded": lambda workdir: FileBackend(SHARDED_TEMPLATE),
+}
+
+
+def make_account(index, args, rng, manager=None, store=None):
+    """Build a synthetic Data account with args.history entries."""
+    return Data(username=f"bench{index}", password="Bench_pw1", balance=rng.randint(0, 10**6) / 100,
+                transaction_history=make_history(args.history, args.note_size, rng),
+                encrypt_manager=manager, full_name=f"Bench User {index}",
+                account_number=str(10**7 + index), date_opened="2024-01-01", store=store)
+
+
+def make_plaintext(args, rng):
+    """The serialized plaintext of one synthetic account (or --payload-size chars)."""
+    if args.payload_size:
+        return "".join(chr(rng.randint(32, 126)) for _ in range(args.payload_size))
+    return "".join(make_account(0, args, rng)._iter_plaintext())
+
+
+@bench("encrypt")
+def bench_encrypt(args, rng, workdir):
+    manager = Encrypt()
+    plain = make_plaintext(args, rng)
+    return (lambda: manager.encrypt(plain)), len(plain), "chars"
+
+
+@bench("decrypt")
+def bench_decrypt(args, rng, workdir):
+    manager = Encrypt()
+    cipher = manager.encrypt(make_plaintext(args, rng))
+    return (lambda: manager.decrypt(cipher)), len(cipher), "chars"
+
+
+@bench("decrypt_old")
+def bench_decrypt_old(args, rng, workdir):
+    manager = Encrypt()
+    # an unversioned payload, like the files written before the format tag
+    cipher = manager.encrypt(make_plaintext(args, rng)).split(":", 1)[1]
+    return (lambda: manager.decrypt_old(cipher)), len(cipher), "chars"
+
+
+@bench("multi_encrypt_text")
+def bench_multi_encrypt_text(args, rng, workdir):
+    if app is None:
+        return None
+    manager = app.MultiAccountEncrypt()
+    key = manager.generate_key()
+    plain = make_plaintext(args, rng).upper()
+
+    def op():
+        key["rotor1_offset"] = 0
+        key["rotor2_offset"] = 0
+        manager.encrypt_text(plain, key)
+    return op, len(plain), "chars"
+
+
+@bench("save_data")
+def bench_save_data(args, rng, workdir):
+    account = make_account(0, args, rng, store=BACKENDS[args.backend](workdir))
+    return account.save_data, 1, "saves"
+
+
+@bench("pull_data")
+def bench_pull_data(args, rng, workdir):
+    store = BACKENDS[args.backend](workdir)
+    make_account(0, args, rng, store=store).save_data()
+
+    def op():
+        Data(store=store, cache=False).pull_data("bench0")
+    return op, 1, "loads"
+
+
+@bench("pull_random")
+def bench_pull_random(args, rng, workdir):
+    # cold loads of random accounts out of a large population (flat vs sharded directories)
+    store = BACKENDS[args.backend](workdir)
+    names = [f"bench{i}" for i in range(args.population)]
+    for name in names:
+        Data(username=name, password="Bench_pw1", balance=1, store=store).save_data()
+    local = random.Random(rng.randrange(1 << 30))
+
+    def op():
+        for _ in range(100):
+            name = local.choice(names)
+            if not Data(store=store, cache=False).pull_data(name):
+                raise RuntimeError(f"{name} not found")
+    return op, 100, "loads"
+
+
+@bench("pull_data_cached")
+def bench_pull_data_cached(args, rng, workdir):
+    store = BACKENDS[args.backend](workdir)
+    make_account(0, args, rng, store=store).save_data()
+
+    def op():
+        Data(store=store).pull_data("bench0")
+    return op, 1, "loads"
+
+
+@bench("ledger_total")
+def bench_ledger_total(args, rng, workdir):
+    ledger = Ledger.from_strings(make_history(args.history, args.note_size, rng))
+    return (lambda: ledger.total(OP_DEPOSIT)), len(ledger), "entries"
+
+
+@bench("history_total")
+def bench_history_total(args, rng, workdir):
+    # the same sum done by parsing the history strings, for comparison
+    history = make_history(args.history, args.note_size, rng)
+
+    def op():
+        sum(round(float(entry.split()[1]) * 100) for entry in history if entry.startswith("Deposited"))
+    return op, len(history), "entries"
+
+
+# group commit windows to compare, in seconds; 0 still batches whatever is queued
+GROUP_COMMIT_WINDOWS = (0.0, 0.001, 0.005, 0.020)
+
+
+def _group_commit_bench(window):
+    def setup(args, rng, workdir):
+        committer = CommitCoordinator(window=window, durability=args.durability)
+        store = BACKENDS[args.backend](workdir)
+        accounts = [make_account(i, args, rng, store=store) for i in range(args.writers)]
+        for account in accounts:
+            account.committer = committer
+
+        def op():
+            # every writer saves its own account at the same moment
+            threads = [threading.Thread(target=account.save_data) for account in accounts]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        return op, len(accounts), "saves"
+    return setup
+
+
+for _window in GROUP_COMMIT_WINDOWS:
+    bench(f"group_commit_{_window * 1000:g}ms")(_group_commit_bench(_window))
+
+
+@bench("save_data_fsync")
+def bench_save_data_fsync(args, rng, workdir):
+    # one writer, one fsync per save: the cost group commit spreads over a batch
+    account = make_account(0, args, rng, store=BACKENDS[args.backend](workdir))
+    account.committer = CommitCoordinator(window=0, max_batch=1, durability=args.durability)
+    return account.save_data, 1, "saves"
+
+
+@bench("transfer_stress")
+def bench_transfer_stress(args, rng, workdir):
+    # many threads moving whole amounts between a few accounts; the total must not change
+    store = BACKENDS[args.backend](workdir)
+    names = [f"bench{i}" for i in range(args.accounts)]
+    for name in names:
+        Data(username=name, password="Bench_pw1", balance=1000, store=store).save_data()
+    engine = TransferEngine(store=store)
+    expected = engine.total_balance(names)
+    seeds = [rng.randrange(1 << 30) for _ in range(args.writers)]
+
+    def writer(seed):
+        local = random.Random(seed)
+        for _ in range(args.transfers):
+            a, b = local.sample(names, 2)
+            engine.transfer(a, b, local.randint(1, 50))
+
+    def op():
+        threads = [threading.Thread(target=writer, args=(seed,)) for seed in seeds]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        total = engine.total_balance(names)
+        if total != expected:
+            raise RuntimeError(f"balance not conserved: {expected} -> {total}")
+    return op, args.writers * args.transfers, "transfers"
+
+
+def _contended_update_bench(checked):
+    def setup(args, rng, workdir):
+        # writers deposit 1 into a few shared accounts, each through its own freshly
+        # loaded Data as separate processes would; unchecked saves lose some deposits
+        store = BACKENDS[args.backend](workdir)
+        names = [f"bench{i}" for i in range(args.accounts)]
+        for name in names:
+            Data(username=name, password="Bench_pw1", store=store).save_data()
+        seeds = [rng.randrange(1 << 30) for _ in range(args.writers)]
+        counts = {"lost_updates": 0, "conflicts": 0}
+        counts_lock = threading.Lock()
+
+        def deposit(name):
+            if checked:
+                _, _, conflicts = update_account(name, lambda a: a.deposit(1, save=False), store=store, cache=False)
+                with counts_lock:
+                    counts["conflicts"] += conflicts
+            else:
+                d = Data(username=name, store=store, cache=False)
+                if d.pull_data(name):
+                    # a plain save (last writer wins) of a change made to a possibly stale copy
+                    d.deposit(1, save=False)
+                    d.save_data()
+
+        def writer(seed):
+            local = random.Random(seed)
+            for _ in range(args.transfers):
+                deposit(local.choice(names))
+
+        def total():
+            d = Data(store=store, cache=False)
+            return sum(d.balance for name in names if d.pull_data(name))
+
+        def op():
+            before = total()
+            threads = [threading.Thread(target=writer, args=(seed,)) for seed in seeds]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            lost = round(before + args.writers * args.transfers - total())
+            counts["lost_updates"] += lost
+            if checked and lost:
+                raise RuntimeError(f"{lost} checked updates were lost")
+        return op, args.writers * args.transfers, "updates", counts
+    return setup
+
+
+bench("update_unchecked")(_contended_update_bench(False))
+bench("update_checked")(_contended_update_bench(True))
+
+
+@bench("report")
+def bench_report(args, rng, workdir):
+    # the whole-bank report over --population accounts with --report-workers processes
+    if args.backend == "memory":
+        return None
+    store = BACKENDS[args.backend](workdir)
+    for i in range(args.population):
+        Data(username=f"bench{i}", password="Bench_pw1", balance=rng.randint(0, 10**6) / 100,
+             transaction_history=make_history(20, 0, rng), date_opened=f"2024-{1 + i % 12:02d}-01",
+             store=store).save_data()
+    spec = ("sqlite", store.path) if args.backend == "sqlite" else ("file", store.filename_template)
+
+    def op():
+        totals = run_report(spec, args.report_workers)["totals"]
+        if totals["accounts"] != args.population:
+            raise RuntimeError(f"report saw {totals['accounts']} of {args.population} accounts")
+    return op, args.population, "accounts"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_one(name, args):
+    """Run one benchmark in a scratch directory. Returns its result dict or None if skipped."""
+    rng = random.Random(args.seed)
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        os.chdir(workdir)
+        try:
+            setup = BENCHMARKS[name](args, rng, workdir)
+            if setup is None:
+                return None
+            op, units, unit_name = setup[:3]
+            counts = setup[3] if len(setup) > 3 else None
+            for _ in range(args.warmup):
+                op()
+            if counts:
+                for key in counts:
+                    counts[key] = 0
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                op()
+                samples.append(time.perf_counter() - start)
+        finally:
+            os.chdir(old_cwd)
+    samples.sort()
+    total = sum(samples)
+    result = {
+        "unit": unit_name,
+        "units_per_op": units,
+        "repeat": len(samples),
+        "mean_s": total / len(samples),
+        "p50_s": percentile(samples, 50),
+        "p90_s": percentile(samples, 90),
+        "p99_s": percentile(samples, 99),
+        "min_s": samples[0],
+        "max_s": samples[-1],
+        "ops_per_s": len(samples) / total if total else 0.0,
+        "units_per_s": units * len(samples) / total if total else 0.0,
+    }
+    if counts:
+        result["counts"] = dict(counts)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare p50 timings against a baseline results dict.
+    Returns a list of (name, old_p50, new_p50, ratio) for regressions above threshold.
+    """
+    regressions = []
+    old = baseline.get("results", {})
+    for name, res in results.items():
+        if name not in old or not old[name].get("p50_s"):
+            continue
+        ratio = res["p50_s"] / old[name]["p50_s"]
+        if ratio > 1.0 + threshold:
+            regressions.append((name, old[name]["p50_s"], res["p50_s"], ratio))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':<22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'ops/s':>12}  throughput")
+    for name, res in results.items():
+        print(f"{name:<22}{res['p50_s'] * 1000:>10.3f}{res['p90_s'] * 1000:>10.3f}{res['p99_s'] * 1000:>10.3f}"
+              f"{res['ops_per_s']:>12.1f}  {res['units_per_s']:.0f} {res['unit']}/s"
+              + "".join(f", {key} {value}" for key, value in res.get("counts", {}).items()))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark cipher and persistence paths.")
+    parser.add_argument("-b", "--bench", action="append", choices=sorted(BENCHMARKS),
+                        help="benchmark to run (repeatable, default: all)")
+    parser.add_argument("--history", type=int, default=1000, help="transactions per synthetic account")
+    parser.add_argument("--note-size", type=int, default=20, help="characters of note per transaction")
+    parser.add_argument("--payload-size", type=int, default=0,
+                        help="use a random plaintext of this many chars for the cipher benchmarks")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="file",
+                        help="storage backend for the persistence benchmarks")
+    parser.add_argument("--writers", type=int, default=16,
+                        help="concurrent accounts saving in the group commit benchmarks")
+    parser.add_argument("--accounts", type=int, default=8,
+                        help="accounts shared by the transfer stress and update benchmarks")
+    parser.add_argument("--transfers", type=int, default=20,
+                        help="transfers (or updates) per writer in the transfer stress and update benchmarks")
+    parser.add_argument("--population", type=int, default=2000, help="accounts created for pull_random and report")
+    parser.add_argument("--report-workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the report benchmark")
+    parser.add_argument("--durability", choices=("none", "batch"), default="batch",
+                        help="durability setting for the group commit benchmarks")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON results file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed p50 slowdown vs baseline before flagging (0.10 = 10%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    names = args.bench or list(BENCHMARKS)
+    results = {}
+    for name in names:
+        res = run_one(name, args)
+        if res is None:
+            print(f"{name}: skipped")
+            continue
+        results[name] = res
+    print_table(results)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+            "params": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old_p50, new_p50, ratio in regressions:
+            print(f"REGRESSION {name}: p50 {old_p50 * 1000:.3f} ms -> {new_p50 * 1000:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
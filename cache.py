@@ -0,0 +1,105 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Process-wide cache of decoded accounts.
+         The GUI builds a fresh Data for every step (login, transfer target,
+         account creation check) and each one decrypted the same file again.
+         The cache keeps the decoded fields of recently used accounts, keyed
+         by backend and username. An entry is only reused while the backend
+         stamp it was loaded with still matches (file size and mtime for the
+         file backend, a version number for the others), so changes made by
+         other processes are picked up. Saves through Data refresh the entry.
+         The cache is an LRU bounded both by entry count and by bytes.
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# rough per-entry overhead on top of the string lengths
+ENTRY_OVERHEAD = 256
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_cache():
+    """The AccountCache shared by every Data in this process."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AccountCache()
+        return _shared
+
+
+class AccountCache:
+    """
+    LRU of decoded accounts.
+    get(store, username) -> (location, fields, history_text) or None
+    put(store, username, location, stamp, fields, history_text)
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # (scope, username) -> (location, stamp, fields, history_text, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, store, username):
+        """Cached state for username if the backend still has the same version of it."""
+        key = (store.cache_scope, username)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            # stat/version check outside the lock
+            if entry[1] is not None and store.stamp(entry[0]) == entry[1]:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return entry[0], entry[2], entry[3]
+            self.invalidate(store, username)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, store, username, location, stamp, fields, history_text):
+        if stamp is None:
+            # the backend cannot tell us when this changes; don't keep it
+            self.invalidate(store, username)
+            return
+        size = ENTRY_OVERHEAD + len(history_text) + sum(len(str(f)) for f in fields)
+        if size > self.max_bytes:
+            self.invalidate(store, username)
+            return
+        key = (store.cache_scope, username)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[4]
+            self._entries[key] = (location, stamp, fields, history_text, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[4]
+
+    def invalidate(self, store, username):
+        with self._lock:
+            old = self._entries.pop((store.cache_scope, username), None)
+            if old is not None:
+                self._bytes -= old[4]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
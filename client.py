@@ -0,0 +1,207 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Client for the account service (service.py).
+         AsyncClient keeps a small pool of connections; every call gets an
+         id, is written straight away (many calls can be in flight on one
+         connection) and is resolved when the response with its id arrives.
+         Calls for the same username always use the same connection, where
+         the service runs them in order, so a pipelined deposit and
+         withdrawal apply in the order they were sent. A call that gets no
+         answer within timeout seconds raises asyncio.TimeoutError.
+         Client is the same thing for plain scripts: it runs an AsyncClient
+         on a background event loop and blocks for each result.
+
+             with Client(port=8765) as c:
+                 c.login("bob", "pw")
+                 c.deposit("bob", "pw", 25)
+                 results = c.pipeline([("balance", {"username": "bob", "password": "pw"})] * 100)
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from service import DEFAULT_HOST, DEFAULT_PORT, LINE_LIMIT, request_accounts
+
+DEFAULT_TIMEOUT = 60.0
+
+
+class ServiceError(Exception):
+    """The service answered a request with ok=false."""
+
+
+class _Connection:
+    """One socket; a reader task routes response lines to waiting futures by id."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        error = ConnectionError("connection closed")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            error = e
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    def send(self, rid, request):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rid] = future
+        self.writer.write((json.dumps(request, separators=(",", ":")) + "\n").encode("utf-8"))
+        return future
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+        self.reader_task.cancel()
+
+
+class AsyncClient:
+    """
+    Pooled, pipelining client.
+    await call(op, **params) -> result dict (raises ServiceError on ok=false)
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, pool_size=4,
+                 timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        # slot -> connection (None until first used, or after it died)
+        self._connections = [None] * self.pool_size
+        self._ids = itertools.count(1)
+        self._next = itertools.count()
+        self._connect_lock = None
+
+    async def _open(self):
+        if self.unix_path:
+            reader, writer = await asyncio.open_unix_connection(self.unix_path, limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+        return _Connection(reader, writer)
+
+    async def _connection(self, request):
+        """
+        The pool connection for request, opening (or replacing a dead) one as
+        needed: picked by username, round-robin for requests without one.
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        names = request_accounts(request)
+        slot = hash(names[0]) % self.pool_size if names else next(self._next) % self.pool_size
+        async with self._connect_lock:
+            conn = self._connections[slot]
+            if conn is None or conn.reader_task.done():
+                conn = self._connections[slot] = await self._open()
+        return conn
+
+    async def send(self, op, **params):
+        """Write one request and return a future for its raw response dict."""
+        rid = next(self._ids)
+        request = dict(params, id=rid, op=op)
+        conn = await self._connection(request)
+        return conn.send(rid, request)
+
+    async def call(self, op, **params):
+        response = await asyncio.wait_for(await self.send(op, **params), self.timeout)
+        if not response.get("ok"):
+            raise ServiceError(response.get("error", "request failed"))
+        return response.get("result", {})
+
+    async def pipeline(self, calls):
+        """Send every (op, params) at once, then collect raw responses in the same order."""
+        futures = [await self.send(op, **params) for op, params in calls]
+        return list(await asyncio.wait_for(asyncio.gather(*futures), self.timeout))
+
+    async def close(self):
+        for conn in self._connections:
+            if conn is not None:
+                await conn.close()
+        self._connections = [None] * self.pool_size
+
+    # convenience wrappers
+    async def login(self, username, password):
+        return await self.call("login", username=username, password=password)
+
+    async def balance(self, username, password):
+        return (await self.call("balance", username=username, password=password))["balance"]
+
+    async def deposit(self, username, password, amount, note=""):
+        return await self.call("deposit", username=username, password=password, amount=amount, note=note)
+
+    async def withdraw(self, username, password, amount, note=""):
+        return await self.call("withdraw", username=username, password=password, amount=amount, note=note)
+
+    async def transfer(self, username, password, to, amount, note=""):
+        return await self.call("transfer", username=username, password=password, to=to, amount=amount, note=note)
+
+    async def history(self, username, password, offset=0, limit=50, newest_first=True):
+        return await self.call("history", username=username, password=password, offset=offset,
+                               limit=limit, newest_first=newest_first)
+
+
+class Client:
+    """Blocking wrapper around AsyncClient for scripts and the REPL."""
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, pool_size=4,
+                 timeout=DEFAULT_TIMEOUT):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="account-client", daemon=True)
+        self._thread.start()
+        self._client = AsyncClient(host, port, unix_path, pool_size, timeout)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def call(self, op, **params):
+        return self._run(self._client.call(op, **params))
+
+    def pipeline(self, calls):
+        return self._run(self._client.pipeline(calls))
+
+    def login(self, username, password):
+        return self._run(self._client.login(username, password))
+
+    def balance(self, username, password):
+        return self._run(self._client.balance(username, password))
+
+    def deposit(self, username, password, amount, note=""):
+        return self._run(self._client.deposit(username, password, amount, note))
+
+    def withdraw(self, username, password, amount, note=""):
+        return self._run(self._client.withdraw(username, password, amount, note))
+
+    def transfer(self, username, password, to, amount, note=""):
+        return self._run(self._client.transfer(username, password, to, amount, note))
+
+    def history(self, username, password, offset=0, limit=50, newest_first=True):
+        return self._run(self._client.history(username, password, offset, limit, newest_first))
+
+    def close(self):
+        if self._loop.is_running():
+            self._run(self._client.close())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,241 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Sorted, memory-mapped form of the combined "name:payload" file.
+         Looking a user up in encrypted_users.txt means reading and comparing
+         every line. encrypted_users.bin holds the same records sorted by
+         name behind an offset table; it is opened with mmap, a lookup binary
+         searches the table and only the matching record is sliced out.
+
+         Layout (little endian):
+             header   8s magic, uint32 count, uint32 reserved,
+                      uint64 source size, uint64 source mtime (ns)
+             table    count x uint64 record offset, in name order
+             records  uint16 name length, uint32 payload length, name, payload
+         Names with several lines keep their original order, so the first
+         valid payload wins exactly as in the line file. The file is ignored
+         once encrypted_users.txt changes after it was built.
+
+         python combined.py rebuild [--source encrypted_users.txt] [--output encrypted_users.bin]
+         python combined.py stats [--output encrypted_users.bin]
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from dirindex import RECHECK_INTERVAL
+
+SOURCE_FILE = "encrypted_users.txt"
+SORTED_FILE = "encrypted_users.bin"
+MAGIC = b"ENCUSRS1"
+HEADER = struct.Struct("<8sIIQQ")
+OFFSET = struct.Struct("<Q")
+RECORD = struct.Struct("<HI")
+# end-of-payload whitespace to trim; trailing spaces are ciphertext (see encrypt.strip_payload)
+TRAILING_WHITESPACE = b"\r\n\t\x0b\x0c"
+
+
+class CombinedFile:
+    """
+    Read-only view of a sorted combined file.
+    payloads(username) -> that user's payloads, in original line order
+    """
+    def __init__(self, path=SORTED_FILE):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        try:
+            magic, self.count, _, self.source_size, self.source_mtime = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a sorted combined file")
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        """(record offset, name length, payload length) of entry i."""
+        offset = OFFSET.unpack_from(self._map, HEADER.size + i * OFFSET.size)[0]
+        name_len, payload_len = RECORD.unpack_from(self._map, offset)
+        return offset + RECORD.size, name_len, payload_len
+
+    def _name_at(self, i):
+        start, name_len, _ = self._record(i)
+        return self._map[start:start + name_len]
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def payloads(self, username):
+        key = username.encode("utf-8")
+        i = self._lower_bound(key)
+        while i < self.count:
+            start, name_len, payload_len = self._record(i)
+            if self._map[start:start + name_len] != key:
+                break
+            start += name_len
+            yield self._map[start:start + payload_len].decode("utf-8")
+            i += 1
+
+    def names(self):
+        out = []
+        for i in range(self.count):
+            name = self._name_at(i).decode("utf-8")
+            if not out or out[-1] != name:
+                out.append(name)
+        return out
+
+
+_opened = {}
+_opened_lock = threading.Lock()
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def open_sorted(path=SORTED_FILE, source=SOURCE_FILE):
+    """
+    Shared CombinedFile for path, or None if it is missing, unreadable or
+    older than source. Files are re-checked at most once per RECHECK_INTERVAL.
+    """
+    key = os.path.abspath(path)
+    now = time.monotonic()
+    with _opened_lock:
+        entry = _opened.get(key)
+        if entry is not None and now - entry[2] < RECHECK_INTERVAL:
+            return entry[1]
+        stamp = _stamp(path)
+        combined = entry[1] if entry is not None and entry[0] == stamp else None
+        if combined is None:
+            if entry is not None and entry[1] is not None:
+                entry[1].close()
+            if stamp is not None:
+                try:
+                    combined = CombinedFile(path)
+                except Exception:
+                    combined = None
+        usable = combined
+        if combined is not None:
+            source_stamp = _stamp(source)
+            if source_stamp is not None and source_stamp != (combined.source_size, combined.source_mtime):
+                # the line file changed since the rebuild; don't answer from stale data
+                usable = None
+        _opened[key] = (stamp, combined, now)
+        return usable
+
+
+def _scan_source(src):
+    """(name, line number, payload start, payload end) for each usable line of the mapped source."""
+    entries = []
+    pos = 0
+    line_no = 0
+    size = len(src)
+    while pos < size:
+        end = src.find(b"\n", pos)
+        if end < 0:
+            end = size
+        colon = src.find(b":", pos, end)
+        if colon >= 0:
+            name = src[pos:colon].strip()
+            start, stop = colon + 1, end
+            # same trimming as encrypt.strip_payload, done on offsets
+            while start < stop and src[start:start + 1].isspace():
+                start += 1
+            while stop > start and src[stop - 1:stop] in TRAILING_WHITESPACE:
+                stop -= 1
+            if stop > start:
+                entries.append((name, line_no, start, stop))
+        pos = end + 1
+        line_no += 1
+    return entries
+
+
+def rebuild(source=SOURCE_FILE, output=SORTED_FILE):
+    """
+    Build the sorted file from the name:payload line file.
+    Only names and offsets are sorted in memory; payloads are copied straight
+    from the mapped source. Returns the number of records written.
+    """
+    source_stamp = _stamp(source)
+    if source_stamp is None:
+        raise FileNotFoundError(source)
+    with open(source, "rb") as f:
+        if source_stamp[0] == 0:
+            src, entries = b"", []
+        else:
+            src = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            entries = _scan_source(src)
+        try:
+            entries.sort(key=lambda e: (e[0], e[1]))
+            tmp = output + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(HEADER.pack(MAGIC, len(entries), 0, source_stamp[0], source_stamp[1]))
+                offset = HEADER.size + OFFSET.size * len(entries)
+                table = []
+                for name, _, start, stop in entries:
+                    table.append(OFFSET.pack(offset))
+                    offset += RECORD.size + len(name) + (stop - start)
+                out.write(b"".join(table))
+                for name, _, start, stop in entries:
+                    out.write(RECORD.pack(len(name), stop - start))
+                    out.write(name)
+                    out.write(src[start:stop])
+            os.replace(tmp, output)
+        finally:
+            if isinstance(src, mmap.mmap):
+                src.close()
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the sorted combined account file.")
+    parser.add_argument("command", choices=("rebuild", "stats"))
+    parser.add_argument("--source", default=SOURCE_FILE, help="name:payload line file")
+    parser.add_argument("--output", default=SORTED_FILE, help="sorted file to write or inspect")
+    args = parser.parse_args(argv)
+    if args.command == "rebuild":
+        count = rebuild(args.source, args.output)
+        print(f"{count} records -> {args.output}")
+        return 0
+    try:
+        combined = CombinedFile(args.output)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    try:
+        print(f"{len(combined)} records, {len(combined.names())} accounts, {os.path.getsize(args.output)} bytes")
+    finally:
+        combined.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
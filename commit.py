@@ -0,0 +1,200 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Group commit for account saves.
+         Without it every Data.save_data opens, writes and closes its own file
+         and nothing is ever fsynced. A CommitCoordinator collects saves from
+         any number of accounts and threads for up to `window` seconds (or
+         until max_batch saves are waiting), writes them together, makes the
+         whole batch durable and only then wakes the waiting callers.
+
+         durability="none"   write and acknowledge; the OS flushes when it
+                             likes (fastest, a crash can lose recent saves)
+         durability="batch"  fsync the batch before acknowledging, so a save
+                             that returned True survives a crash
+
+         The window trades latency for throughput: a save waits up to window
+         seconds, and the fsync cost is shared by every save in its batch.
+         Files are written to a temp name and renamed, so a crash never leaves
+         half an account; the renames are followed by one directory fsync per
+         batch. Saves to a backend with put_many (SegmentStore, SQLiteBackend)
+         become one append or transaction per batch.
+
+             committer = CommitCoordinator(window=0.005, durability="batch")
+             Data(..., committer=committer).save_data()
+"""
+import os
+import threading
+import time
+
+DURABILITY_NONE = "none"
+DURABILITY_BATCH = "batch"
+DURABILITIES = (DURABILITY_NONE, DURABILITY_BATCH)
+DEFAULT_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 128
+TEMP_SUFFIX = ".commit"
+
+
+class _Pending:
+    """One queued save; every caller waiting on the same key shares it."""
+    def __init__(self, payload):
+        self.payload = payload
+        self.ok = False
+        self.done = threading.Event()
+
+
+class CommitCoordinator:
+    """
+    Batches account writes from many threads.
+    submit(fname, payload) -> True once the payload is written (and durable
+    when durability="batch"), False if the write failed.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH, durability=DURABILITY_BATCH):
+        if durability not in DURABILITIES:
+            raise ValueError(f"durability must be one of {DURABILITIES}")
+        self.window = max(0.0, float(window))
+        self.max_batch = max(1, int(max_batch))
+        self.durability = durability
+        # fname or (store, username) -> _Pending
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.fsyncs = 0
+
+    def submit(self, fname, payload, store=None):
+        """
+        Queue payload for fname (or for username fname in store) and wait for its
+        batch to commit. A newer payload for a key that is still queued replaces
+        the older one; both callers get the result of the single write.
+        """
+        key = fname if store is None else (store, fname)
+        with self._cond:
+            if self._closed:
+                entry = _Pending(payload)
+                self._commit({key: entry})
+                return entry.ok
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = _Pending(payload)
+            else:
+                entry.payload = payload
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="commit-coordinator", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        entry.done.wait()
+        return entry.ok
+
+    def flush(self):
+        """Commit whatever is queued now, without waiting for the window."""
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if batch:
+            self._commit(batch)
+
+    def close(self):
+        """Commit the queue and stop the background thread; later submits write inline."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # the first save opens the window; more may join until it closes or fills
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, {}
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Write one batch, make it durable if asked, then wake its callers."""
+        sync = self.durability == DURABILITY_BATCH
+        files = []
+        stores = {}
+        for key, entry in batch.items():
+            if isinstance(key, tuple):
+                stores.setdefault(key[0], []).append((key[1], entry))
+            else:
+                files.append((key, entry))
+        try:
+            if files:
+                self._commit_files(files, sync)
+            for store, items in stores.items():
+                try:
+                    ok = store.put_many([(name, entry.payload) for name, entry in items], sync=sync)
+                except Exception:
+                    ok = False
+                for _, entry in items:
+                    entry.ok = bool(ok)
+                self.writes += len(items)
+                if sync:
+                    self.fsyncs += 1
+            self.batches += 1
+        finally:
+            for entry in batch.values():
+                entry.done.set()
+
+    def _commit_files(self, files, sync):
+        # write every temp file first, then fsync them together, so the disk
+        # sees one burst of flushes per batch instead of one per save
+        written = []
+        for fname, entry in files:
+            tmp = fname + TEMP_SUFFIX
+            try:
+                f = open(tmp, "w", encoding="utf-8")
+                try:
+                    f.write(entry.payload)
+                    f.flush()
+                except Exception:
+                    f.close()
+                    raise
+                written.append((fname, tmp, f, entry))
+            except Exception:
+                entry.ok = False
+        directories = set()
+        for fname, tmp, f, entry in written:
+            try:
+                with f:
+                    if sync:
+                        os.fsync(f.fileno())
+                        self.fsyncs += 1
+                os.replace(tmp, fname)
+                entry.ok = True
+                directories.add(os.path.dirname(os.path.abspath(fname)))
+            except Exception:
+                entry.ok = False
+        self.writes += len(written)
+        if sync:
+            # the renames themselves are only durable once the directory is synced
+            for directory in directories:
+                self._fsync_directory(directory)
+
+    def _fsync_directory(self, directory):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            # not supported everywhere (Windows); the file fsyncs still happened
+            return
+        try:
+            os.fsync(fd)
+            self.fsyncs += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
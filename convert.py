@@ -0,0 +1,227 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Convert account files written by __app.Data into the data.py layout.
+         __app files look like "username:<rotor ciphertext>" and decode (with
+         the account's key from the keystore) to
+             "Balance: $x; Password: y; tx; tx"
+         data.py files are "v1:seed:payload" and decode to
+             full_name,username,password,balance,account_number,date_opened,tx;tx
+         Each file is read in chunks and run through a streaming parser, files
+         are handed out lazily to a process pool, and every converted account
+         is loaded back and compared before the original is replaced; the
+         original is kept next to it as encrypted_<name>.txt.app-backup.
+
+         python convert.py [directory] [--keystore keystore.bin] [--workers 4] [--dry-run]
+"""
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from data import Data
+from encrypt import Encrypt, iter_file_chunks, header_version
+from keystore import KeyStore
+
+PREFIX = "encrypted_"
+SUFFIX = ".txt"
+# the untouched __app file is copied here before it is replaced
+BACKUP_SUFFIX = ".app-backup"
+
+# per-process state for pool workers
+_manager = None
+
+
+def _rotor_manager(keystore_path):
+    """A MultiAccountEncrypt backed by the keystore, one per process."""
+    global _manager
+    if _manager is None:
+        # imported here: __app pulls in tkinter, which only the converter needs
+        from __app import MultiAccountEncrypt
+        _manager = MultiAccountEncrypt(keystore=KeyStore(keystore_path))
+    return _manager
+
+
+def iter_app_files(directory):
+    """Yield (username, path) for every encrypted_<name>.txt without listing into memory."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if entry.is_file() and name.startswith(PREFIX) and name.endswith(SUFFIX):
+                yield name[len(PREFIX):-len(SUFFIX)], entry.path
+
+
+def iter_app_fields(chunks):
+    """
+    Streaming parser for the __app plaintext layout.
+    Yields ("balance", value), ("password", value) or ("tx", entry) as the
+    "; "-separated parts arrive, same rules as __app.Data._parse_plaintext,
+    except that an unreadable balance is yielded as None instead of 0.
+    """
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        *parts, buf = buf.split(";")
+        for part in parts:
+            field = _app_field(part)
+            if field:
+                yield field
+    field = _app_field(buf)
+    if field:
+        yield field
+
+
+def _app_field(part):
+    p = part.strip()
+    if not p:
+        return None
+    if p.lower().startswith("balance:"):
+        val = p.split(":", 1)[1].strip()
+        digits = "".join(ch for ch in val if ch.isdigit() or ch == "." or ch == "-")
+        try:
+            if "." in digits:
+                return "balance", float(digits)
+            return "balance", int(digits) if digits != "" else 0
+        except Exception:
+            return "balance", None
+    if p.lower().startswith("password:"):
+        return "password", p.split(":", 1)[1].strip()
+    return "tx", p
+
+
+def iter_app_plaintext(path, username, manager):
+    """
+    Read an __app file and yield its decoded plaintext in chunks.
+    Raises ValueError if the file is not in the __app layout or has no key.
+    """
+    key = manager.get_key(username)
+    if key is None:
+        raise ValueError("no key for account in keystore")
+    key["rotor1_offset"] = 0
+    key["rotor2_offset"] = 0
+    with open(path, "r", encoding="utf-8") as f:
+        chunks = iter_file_chunks(f)
+        head = next(chunks, "")
+        if ":" not in head:
+            raise ValueError("not an __app account file")
+        name, rest = head.split(":", 1)
+        if name != username:
+            raise ValueError("not an __app account file")
+        # the rotor offsets live in key, so chunk-by-chunk equals one big call
+        if rest:
+            yield manager.decrypt_text(rest, key)
+        for chunk in chunks:
+            yield manager.decrypt_text(chunk, key)
+
+
+def is_app_layout(path, username):
+    """True if the file starts with "username:" rather than a data.py cipher header."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(len(username) + 64).strip()
+    return header_version(head) is None and head.startswith(username + ":")
+
+
+def convert_file(username, path, keystore_path="keystore.bin", dry_run=False):
+    """
+    Convert one __app account file in place.
+    Returns (path, status, message); status is "converted", "skipped" or "error".
+    """
+    try:
+        if not is_app_layout(path, username):
+            return path, "skipped", "not in __app layout"
+        manager = _rotor_manager(keystore_path)
+        account = Data(username=username, encrypt_manager=Encrypt())
+        seen = set()
+        for kind, value in iter_app_fields(iter_app_plaintext(path, username, manager)):
+            if kind == "balance":
+                if value is None:
+                    return path, "error", "unreadable balance, wrong key?"
+                account.balance = float(value)
+                seen.add(kind)
+            elif kind == "password":
+                account.password = value
+                seen.add(kind)
+            else:
+                account.transaction_history.append(value)
+                if not account.date_opened and value.startswith("Account created at "):
+                    account.date_opened = value[len("Account created at "):][:10]
+        # both fields come out of any real __app account; without them the key
+        # did not decode the file and the original must stay
+        if seen != {"balance", "password"}:
+            return path, "error", "no Balance: or Password: field, wrong key?"
+        if dry_run:
+            return path, "converted", f"dry run, {len(account.transaction_history)} transactions"
+
+        tmp = path + ".converting"
+        with open(tmp, "w", encoding="utf-8") as f:
+            account.manager.encrypt_to_file(account._iter_plaintext(), f)
+
+        # round trip: decode what we wrote and compare before replacing
+        check = Data(encrypt_manager=account.manager)
+        with open(tmp, "r", encoding="utf-8") as f:
+            ok = check._parse_chunks(account.manager.decrypt_stream(iter_file_chunks(f)))
+        same = ok and (check.username, check.password, check.balance, check.date_opened,
+                       check.transaction_history) == (account.username, account.password, account.balance,
+                                                      account.date_opened, account.transaction_history)
+        if not same:
+            os.remove(tmp)
+            return path, "error", "round trip check failed"
+        shutil.copy2(path, path + BACKUP_SUFFIX)
+        os.replace(tmp, path)
+        return path, "converted", f"{len(account.transaction_history)} transactions"
+    except Exception as e:
+        return path, "error", str(e)
+
+
+def _convert_task(args):
+    return convert_file(*args)
+
+
+def convert_directory(directory=".", keystore_path="keystore.bin", workers=None, dry_run=False, on_result=None):
+    """Convert every __app account file under directory. Returns a dict of status counts."""
+    tasks = ((username, path, keystore_path, dry_run) for username, path in iter_app_files(directory))
+    counts = {}
+
+    def record(result):
+        counts[result[1]] = counts.get(result[1], 0) + 1
+        if on_result:
+            on_result(result)
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map consumes the generator up front, so feed it in bounded batches
+            batch = []
+            for task in tasks:
+                batch.append(task)
+                if len(batch) >= workers * 64:
+                    for result in pool.map(_convert_task, batch, chunksize=16):
+                        record(result)
+                    batch = []
+            for result in pool.map(_convert_task, batch, chunksize=16):
+                record(result)
+    else:
+        for task in tasks:
+            record(_convert_task(task))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert __app account files to the data.py layout.")
+    parser.add_argument("directory", nargs="?", default=".")
+    parser.add_argument("--keystore", default="keystore.bin", help="keystore holding the __app rotor keys")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dry-run", action="store_true", help="parse and report, write nothing")
+    args = parser.parse_args(argv)
+
+    def show(result):
+        if result[1] != "skipped":
+            print(f"{result[1]:<10} {result[0]}  {result[2]}")
+
+    counts = convert_directory(args.directory, args.keystore, args.workers, args.dry_run, on_result=show)
+    print(", ".join(f"{k}: {v}" for k, v in sorted(counts.items())) or "nothing to do")
+    return 1 if counts.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
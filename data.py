@@ -1,4 +1,11 @@
-from encrypt import Encrypt
+from encrypt import Encrypt, header_version, ALPHABET_CURRENT, ALPHABET_LEGACY
+from cache import get_cache
+from history import LazyHistory
+from ledger import Ledger
+from shards import current_layout
+from storage import FileBackend, RevisionConflict, COMBINED_FILE
+import math
+import random
 import time
 
 """
@@ -7,13 +14,148 @@ Stores: full_name, username, password, balance, account_number, date_opened,
 transaction_history and interest_rate.
 
 Files are stored encrypted using the provided Encrypt manager.
-Filename template default: "encrypted_{username}.txt"
+Filename template default: "encrypted_{username}.txt"; a template with
+"{shard}" (or a directory resharded with shards.py) spreads the files over
+hash-prefix subdirectories.
+Where accounts live is up to the storage backend (storage.py), chosen with
+store=...: FileBackend (default, one file per account), MemoryBackend,
+SQLiteBackend or segstore.SegmentStore.
+Pass committer=CommitCoordinator(...) (commit.py) to group saves from many
+accounts into batched, optionally fsynced writes.
+
+With incremental=True (file backend only), deposit/withdraw/transfer append
+one small encrypted delta line to "<account file>.log" instead of rewriting the whole account.
+Each delta is "seq,balance,entry" where seq is the history length after the
+entry, so replaying a delta that is already in the snapshot is a no-op. Once
+the log passes COMPACT_MAX_DELTAS lines or COMPACT_MAX_BYTES, the change that
+crossed the limit folds it into a fresh snapshot (one full save per that many
+changes).
+
+A loaded transaction_history is a history.LazyHistory: the ";"-joined text is
+kept as is and only split when entries are read, so logging in does not pay
+for building every history string.
+
+Loaded and saved accounts are kept in a process-wide cache (cache.py), so a
+repeated load of an unchanged account is not decrypted again. Pass
+cache=False to always read from the backend.
+
+Every stored account carries a revision that goes up on each save; a Data
+remembers the revision it loaded. save_data() overwrites whatever is stored
+(last writer wins), save_data(check_revision=True) only saves if nobody else
+has saved since the load. update_account() wraps that in a reload-and-retry
+loop for read-modify-write changes made from several processes at once;
+deposit/withdraw/transfer and change_password do the same on their own
+object (reload, make the change again, save checked). Delta lines
+(incremental=True) are checked too: the file's revision and the log's length
+must be the ones loaded.
 """
 
+COMPACT_MAX_DELTAS = 64
+COMPACT_MAX_BYTES = 256 * 1024
+# update_account: tries before giving up, and the first backoff in seconds (doubles per conflict)
+UPDATE_ATTEMPTS = 20
+UPDATE_BACKOFF = 0.001
+# characters that would split a stored record: "," separates the header
+# fields, ";" the history entries and a line break the delta log lines
+USERNAME_FORBIDDEN = (",", ";", "\n", "\r")
+NOTE_FORBIDDEN = (";", "\n", "\r")
+
+
+def account_header(plain):
+    """
+    The six header fields (full_name, username, password, balance,
+    account_number, date_opened) at the start of a decrypted account, or None
+    if plain does not start with them. A payload decrypted with the wrong
+    alphabet still has commas, so a non-empty username and a finite numeric
+    balance are required too.
+    """
+    parts = plain.split(",", 6) if plain else []
+    if len(parts) < 6 or not parts[1]:
+        return None
+    try:
+        balance = float(parts[3])
+    except ValueError:
+        return None
+    return parts[:6] if math.isfinite(balance) else None
+
+
+def parse_amount(amount):
+    """amount as a float if it is a finite number above zero, else None."""
+    try:
+        amt = float(amount)
+    except Exception:
+        return None
+    return amt if math.isfinite(amt) and amt > 0 else None
+
+
+def valid_note(note):
+    """True if note (a history note) has no separator character in it."""
+    return not any(c in note for c in NOTE_FORBIDDEN) if note else True
+
+
+def valid_username(username):
+    """True if username is non-empty and has no separator character in it."""
+    return bool(username) and not any(c in username for c in USERNAME_FORBIDDEN)
+
+
+def save_all(accounts, check_revision=False):
+    """
+    Save several accounts (sharing one backend) all-or-nothing.
+    Returns True if every account was written, False if none was.
+    With check_revision=True, raises RevisionConflict (and writes nothing)
+    if any of them was saved by someone else since it was loaded. Raises
+    storage.WritePending if the save is committed but not yet in every file.
+    """
+    if not accounts:
+        return True
+    store = accounts[0].store
+    items = []
+    for account in accounts:
+        account._found = None
+        items.append((account.username, account._iter_ciphertext(), account._loaded_filename,
+                      account._expected_revision() if check_revision else None))
+    written = store.write_many(items)
+    if not written:
+        return False
+    for account, (location, revision, stamp) in zip(accounts, written):
+        account._loaded_filename = location
+        account.revision = revision
+        account._delta_count = 0
+        account._delta_bytes = 0
+        account._remember(stamp)
+    return True
+
+
+def update_account(username, change, attempts=UPDATE_ATTEMPTS, **data_args):
+    """
+    Optimistic read-modify-write of one account. Loads username, calls
+    change(account) to edit it in memory (e.g. lambda a: a.deposit(5, save=False))
+    and saves only if nobody saved the account in between; on a conflict the
+    account is reloaded and change applied again, after a short random backoff.
+    change returning False aborts without saving. data_args go to Data(...).
+    Returns (ok, account, conflicts).
+    """
+    account = None
+    conflicts = 0
+    for attempt in range(attempts):
+        account = Data(username=username, **data_args)
+        if not account.pull_data(username):
+            return False, None, conflicts
+        if change(account) is False:
+            return False, account, conflicts
+        try:
+            return account._save(account._expected_revision()), account, conflicts
+        except RevisionConflict:
+            conflicts += 1
+            time.sleep(random.uniform(0, UPDATE_BACKOFF * (1 << min(attempt, 10))))
+    return False, account, conflicts
+
+
 class Data:
     def __init__(self, username="", password="", balance=0, transaction_history=None,
                  encrypt_manager=None, filename_template="encrypted_{username}.txt",
-                 full_name="", account_number=None, date_opened=None, interest_rate=0.0225):
+                 full_name="", account_number=None, date_opened=None, interest_rate=0.0225,
+                 store=None, incremental=False, committer=None, cache=True):
         self.username = username
         self.password = password
         self.full_name = full_name
@@ -25,147 +167,351 @@ class Data:
         self.account_number = account_number
         self.date_opened = date_opened
         self.interest_rate = float(interest_rate)
-        # remember the exact file we loaded from so saves go back to same file
+        # remember the exact file (backend location) we loaded from so saves go back to same place
         self._loaded_filename = None
+        # (username, filename, version, stamp, revision) located by find_encrypted_payload
+        self._found = None
+        # storage backend; per-account files unless another one is given
+        self.store = store if store is not None else FileBackend(filename_template)
+        # append deltas instead of rewriting the file on every balance change
+        self.incremental = incremental
+        # optional commit.CommitCoordinator that batches and fsyncs saves
+        self.committer = committer
+        # decoded-account cache: True for the shared one, or an AccountCache
+        self.cache = get_cache() if cache is True else (None if cache is False else cache)
+        self._delta_count = 0
+        self._delta_bytes = 0
+        # revision of the stored account this object was loaded from or last saved as
+        # (0: not stored yet, None: not known, e.g. saved through a committer)
+        self.revision = 0
 
     def get_encrypted_filename(self):
-        """Return the primary filename for this account."""
-        return self.filename_template.format(username=self.username)
-
-    def _possible_filenames(self, username):
-        """Common filename variants to try."""
-        return [
-            f"encrypted_{username}.txt",
-            f"encrypted {username}.txt",
-            f"encrypted{username}.txt",
-            f"encrypted-{username}.txt",
-            self.filename_template.format(username=username),
-        ]
-
-    def save_data(self):
-        """
-        Serialize account fields, encrypt and write to file.
-        Prefer writing back to the same filename we loaded from, if any.
-        Format before encryption:
-          full_name,username,password,balance,account_number,date_opened,tx1;tx2;...
+        """Return the primary filename for this account (its shard directory included)."""
+        return current_layout(self.filename_template).filename(self.username)
+
+    def _iter_plaintext(self, batch_size=512):
+        """
+        Yield the serialized account in pieces: the header fields first, then
+        the history in batches, so the full plaintext is never built at once.
         """
         if not self.date_opened:
             self.date_opened = time.strftime("%Y-%m-%d", time.localtime())
         account_number = self.account_number or ""
-        txs = ";".join(self.transaction_history)
-        plain = f"{self.full_name},{self.username},{self.password},{self.balance},{account_number},{self.date_opened},{txs}"
-        ciphertext = self.manager.encrypt(plain)
+        yield f"{self.full_name},{self.username},{self.password},{self.balance},{account_number},{self.date_opened},"
+        history = self.transaction_history
+        if hasattr(history, "iter_joined"):
+            # a lazily loaded history goes back out without being split
+            pieces = history.iter_joined(batch_size)
+        else:
+            pieces = (";".join(history[start:start + batch_size]) for start in range(0, len(history), batch_size))
+        sep = ""
+        for piece in pieces:
+            yield sep + piece
+            sep = ";"
 
-        # prefer the originally loaded filename so we don't create duplicate files
-        fname = self._loaded_filename if getattr(self, "_loaded_filename", None) else self.get_encrypted_filename()
+    def _iter_ciphertext(self):
+        """Encrypted account in pieces (one piece when the manager cannot stream)."""
+        if hasattr(self.manager, "encrypt_stream"):
+            return self.manager.encrypt_stream(self._iter_plaintext())
+        return iter([self.manager.encrypt("".join(self._iter_plaintext()))])
 
-        # try to write; if path has dirs and write fails, fallback to base name
+    def save_data(self, check_revision=False):
+        """
+        Serialize account fields, encrypt and write them through the backend.
+        Prefer writing back to the same location we loaded from, if any.
+        Format before encryption:
+          full_name,username,password,balance,account_number,date_opened,tx1;tx2;...
+        The ciphertext is streamed, so memory does not grow with history.
+        With check_revision=True nothing is written (returns False) if the
+        stored account changed since it was loaded; see update_account().
+        """
         try:
-            with open(fname, "w", encoding="utf-8") as f:
-                f.write(ciphertext)
-        except Exception:
-            # fallback: write to base filename only (no os import)
-            if "\\" in fname:
-                base = fname.split("\\")[-1]
-            elif "/" in fname:
-                base = fname.split("/")[-1]
-            else:
-                base = fname
-            with open(base, "w", encoding="utf-8") as f:
-                f.write(ciphertext)
-            # record that we saved to fallback name
-            self._loaded_filename = base
+            return self._save(self._expected_revision() if check_revision else None)
+        except RevisionConflict:
+            return False
+
+    def _expected_revision(self):
+        if self.revision is None:
+            raise RevisionConflict(f"{self.username}: revision unknown, reload first")
+        return self.revision
 
+    def _save(self, expected_revision=None):
+        """save_data(); raises RevisionConflict when expected_revision is stale."""
+        self._found = None
+        # the method itself, not its iterator: a write that has to start over encrypts again
+        written = self.store.write(self.username, self._iter_ciphertext, location=self._loaded_filename,
+                                   committer=self.committer, expected_revision=expected_revision)
+        if not written:
+            return False
+        self._loaded_filename, self.revision, stamp = written
+        # a full save folds in every delta
+        self._delta_count = 0
+        self._delta_bytes = 0
+        self._remember(stamp)
         return True
 
-    def find_encrypted_payload(self, username):
+    def _persist_change(self, entry):
         """
-        Locate and validate an encrypted payload for username.
-        Returns (payload, filename) or (None, None).
+        Persist one change; entry is the history entry it appended (None for a
+        change with no entry, e.g. a new password). Incremental accounts that
+        already have a snapshot file get a delta line; everything else (and
+        backends without delta logs) gets a full save. Both are checked against
+        the revision (and delta log) this object was loaded with; raises
+        RevisionConflict if someone else saved the account since.
+        """
+        fname = self._loaded_filename
+        if (entry is None or not self.incremental or not hasattr(self.store, "append_delta") or not fname
+                or fname == COMBINED_FILE):
+            return self._save(self._expected_revision())
+        seq = len(self.transaction_history)
+        line = self.manager.encrypt(f"{seq},{self.balance},{entry}".replace("\n", " ")) + "\n"
+        stamp = self.store.append_delta(fname, line, expected_revision=self._expected_revision(),
+                                        expected_deltas=self._delta_count)
+        if stamp is False:
+            # the file moved (resharding): a full save writes it at its new path
+            return self._save(self._expected_revision())
+        self._delta_count += 1
+        self._delta_bytes += len(line)
+        self._remember(stamp)
+        if self._delta_count >= COMPACT_MAX_DELTAS or self._delta_bytes >= COMPACT_MAX_BYTES:
+            # in line, not on a thread: a snapshot racing further changes to this
+            # object could miss one and then drop its delta with the log
+            self.compact()
+        return True
+
+    def _apply_change(self, change, save=True):
+        """
+        Make a change and, with save, persist it. change(account) edits the
+        account in memory and returns the history entry it added (None if it
+        adds none) or False to refuse. If someone else saved the account since
+        this object was loaded, it is reloaded and change made again on the
+        fresh copy (as update_account() does), so no save is overwritten.
+        Returns True/False.
+        """
+        entry = change(self)
+        if entry is False:
+            return False
+        if not save:
+            return True
+        for attempt in range(UPDATE_ATTEMPTS):
+            try:
+                return self._persist_change(entry)
+            except RevisionConflict:
+                time.sleep(random.uniform(0, UPDATE_BACKOFF * (1 << min(attempt, 10))))
+            if not self.pull_data(self.username):
+                return False
+            entry = change(self)
+            if entry is False:
+                return False
+        return False
+
+    def compact(self):
+        """Write a full snapshot and drop the delta log (skipped if the account changed underneath)."""
+        return self.save_data(check_revision=True)
+
+    def _replay_deltas(self):
+        """Apply "<account file>.log" on top of the loaded snapshot."""
+        self._delta_count = 0
+        self._delta_bytes = 0
+        if not hasattr(self.store, "read_deltas") or not self._loaded_filename:
+            return
+        for line in self.store.read_deltas(self._loaded_filename):
+            self._delta_count += 1
+            self._delta_bytes += len(line)
+            plain = self.manager.decrypt(line.rstrip("\n"))
+            parts = plain.split(",", 2)
+            if len(parts) < 3:
+                # torn last line from a crash mid-append
+                continue
+            try:
+                seq = int(parts[0])
+                balance = float(parts[1])
+            except ValueError:
+                continue
+            # seq <= len(history) means the snapshot already has this entry
+            if seq == len(self.transaction_history) + 1:
+                self.balance = balance
+                self.transaction_history.append(parts[2])
+
+    def _decrypt_chunks(self, chunks, version=ALPHABET_CURRENT):
+        """Decrypt ciphertext chunks; version is the alphabet to use when the header has none."""
+        if hasattr(self.manager, "decrypt_stream"):
+            return self.manager.decrypt_stream(chunks, version=version)
+        payload = "".join(chunks)
+        if version == ALPHABET_LEGACY and hasattr(self.manager, "decrypt_old"):
+            return iter([self.manager.decrypt_old(payload)])
+        return iter([self.manager.decrypt(payload)])
+
+    def _detect_version(self, first_chunk):
+        """
+        Work out which alphabet a payload uses.
+        A "v<n>:" header answers straight away; unversioned payloads are
+        test-decrypted (first chunk only) with the current then the legacy
+        alphabet. Returns the alphabet version or None.
+        """
+        version = header_version(first_chunk)
+        if version is not None:
+            return version
+        head = next(iter(self._decrypt_chunks([first_chunk])), "")
+        if account_header(head) is not None:
+            return ALPHABET_CURRENT
+        if hasattr(self.manager, "decrypt_old"):
+            head = next(iter(self._decrypt_chunks([first_chunk], version=ALPHABET_LEGACY)), "")
+            if account_header(head) is not None:
+                return ALPHABET_LEGACY
+        return None
+
+    def _locate(self, username):
+        """
+        Find where username is stored without reading whole files.
+        Returns (location, payload, version) where payload is only set when the
+        backend already has it in hand, or (None, None, None).
         """
         if not self.manager:
             self.manager = Encrypt()
+        return self.store.lookup(username, self._detect_version)
 
-        # try variants
-        for fname in self._possible_filenames(username):
-            try:
-                with open(fname, "r", encoding="utf-8") as f:
-                    payload = f.read().strip()
-                    if not payload:
-                        continue
-                    plain = self.manager.decrypt(payload)
-                    if not plain or "," not in plain:
-                        if hasattr(self.manager, "decrypt_old"):
-                            plain = self.manager.decrypt_old(payload)
-                    if plain and "," in plain:
-                        return payload, fname
-            except FileNotFoundError:
+    def find_encrypted_payload(self, username):
+        """
+        Locate and validate the stored account for username.
+        Returns (filename, alphabet version) or (None, None).
+        Only the first chunk is read and, if unversioned, decrypted to
+        validate it; nothing else is read or kept. Where the account was
+        found is remembered, so a following pull_data(username) streams it
+        from there without looking it up again.
+        """
+        self._found = None
+        fname, payload, version = self._locate(username)
+        if not fname:
+            return None, None
+        if payload is None:
+            # a payload the backend handed over (combined file) is simply looked up again
+            self._found = (username, fname, version, self.store.stamp(fname), self.store.revision(fname))
+        return fname, version
+
+    def _parse_chunks(self, chunks):
+        """
+        Parse decrypted plaintext chunks into account fields.
+        Only the six header fields are split out; the history text is kept
+        joined in a LazyHistory. Returns True on success.
+        """
+        header = None
+        buf = ""
+        body = []
+        for chunk in chunks:
+            if header is not None:
+                body.append(chunk)
                 continue
-            except Exception:
+            buf += chunk
+            if buf.count(",") < 6:
                 continue
+            parts = buf.split(",", 6)
+            header = parts[:6]
+            body.append(parts[6])
+        if header is None:
+            if "," not in buf:
+                return False
+            parts = buf.split(",", 6)
+            if len(parts) < 6:
+                return False
+            header = parts[:6]
+            body.append(parts[6] if len(parts) > 6 else "")
 
-        # fallback combined file
+        self.full_name = header[0]
+        self.username = header[1]
+        self.password = header[2]
         try:
-            with open("encrypted_users.txt", "r", encoding="utf-8") as f:
-                for line in f.read().splitlines():
-                    if ':' not in line:
-                        continue
-                    name, payload = line.split(':', 1)
-                    if name.strip() != username:
-                        continue
-                    payload = payload.strip()
-                    if not payload:
-                        continue
-                    plain = self.manager.decrypt(payload)
-                    if not plain or "," not in plain:
-                        if hasattr(self.manager, "decrypt_old"):
-                            plain = self.manager.decrypt_old(payload)
-                    if plain and "," in plain:
-                        return payload, "encrypted_users.txt"
-        except FileNotFoundError:
-            pass
+            self.balance = float(header[3])
         except Exception:
-            pass
-
-        return None, None
+            self.balance = 0.0
+        self.account_number = header[4] if header[4] else None
+        self.date_opened = header[5] if header[5] else None
+        self.transaction_history = LazyHistory("".join(body))
+        return True
 
     def pull_data(self, username):
         """
         Load account from disk. Populate fields.
         Returns True on success, False if no valid data found.
+        Uses an unchanged cached copy, or the location found by a preceding
+        find_encrypted_payload(username); the file is decrypted and parsed
+        chunk by chunk, once.
         """
-        payload, fname = self.find_encrypted_payload(username)
-        if not payload:
-            return False
+        found = self._found
+        self._found = None
+        cached = self._cache_lookup(username)
+        if cached is not None:
+            self._apply_cached(cached)
+            return True
+        for attempt in range(2):
+            if attempt == 0 and found is not None and found[0] == username:
+                _, fname, version, stamp, revision = found
+                payload = None
+            else:
+                fname, payload, version = self._locate(username)
+                if not fname:
+                    return False
+                # taken before reading, so a write racing the read makes the entry stale, not wrong
+                # (and makes a checked save conflict instead of overwriting that write)
+                stamp = self.store.stamp(fname)
+                revision = self.store.revision(fname)
 
-        # remember loaded filename so future saves go to same place
-        self._loaded_filename = fname
+            # remember loaded filename so future saves go to same place
+            self._loaded_filename = fname
+            self.revision = revision
 
-        plain = self.manager.decrypt(payload)
-        if (not plain or "," not in plain) and hasattr(self.manager, "decrypt_old"):
-            plain = self.manager.decrypt_old(payload)
-        if not plain or "," not in plain:
-            return False
-        parts = plain.split(',', 6)
-        if len(parts) < 6:
+            if payload is not None:
+                ok = self._parse_chunks(self._decrypt_chunks([payload], version=version))
+                break
+            try:
+                ok = self._parse_chunks(self._decrypt_chunks(self.store.open_chunks(fname), version=version))
+                break
+            except FileNotFoundError:
+                # moved (by a reshard) since it was found: look it up again
+                continue
+            except Exception:
+                return False
+        else:
             return False
-        self.full_name = parts[0]
-        self.username = parts[1]
-        self.password = parts[2]
-        try:
-            self.balance = float(parts[3])
-        except Exception:
-            self.balance = 0.0
-        self.account_number = parts[4] if parts[4] else None
-        self.date_opened = parts[5] if parts[5] else None
-        txs = parts[6] if len(parts) > 6 else ""
-        self.transaction_history = txs.split(';') if txs else []
-        return True
+        if ok:
+            self._replay_deltas()
+            self._remember(stamp)
+        return ok
+
+    def _cache_lookup(self, username):
+        if self.cache is None:
+            return None
+        return self.cache.get(self.store, username)
+
+    def _apply_cached(self, cached):
+        location, fields, history_text = cached
+        (self.full_name, self.username, self.password, self.balance, self.account_number,
+         self.date_opened, self._delta_count, self._delta_bytes, self.revision) = fields
+        self.transaction_history = LazyHistory(history_text)
+        self._loaded_filename = location
+
+    def _remember(self, stamp):
+        """
+        Put the current state in the cache; stamp is the backend stamp it
+        matches, as read or returned by the write itself (reading it afterwards
+        could pick up another writer's save). None drops the entry instead.
+        """
+        if self.cache is None or not self._loaded_filename:
+            return
+        history = self.transaction_history
+        if hasattr(history, "iter_joined"):
+            text = ";".join(history.iter_joined())
+        else:
+            text = ";".join(history)
+        fields = (self.full_name, self.username, self.password, self.balance, self.account_number,
+                  self.date_opened, self._delta_count, self._delta_bytes, self.revision)
+        self.cache.put(self.store, self.username, self._loaded_filename, stamp, fields, text)
 
     def change_password(self, new_password):
-        """Change password and persist."""
-        self.password = new_password
-        return self.save_data()
+        """Change password and persist (on top of any save made since the load)."""
+        def change(account):
+            account.password = new_password
+        return self._apply_change(change)
 
     def compute_savings_interest(self):
         """Compute interest since date_opened using daily compounding (time module)."""
@@ -184,48 +530,59 @@ class Data:
         interest = self.balance * ((1 + daily) ** days - 1)
         return interest
 
+    def ledger(self):
+        """The history as a columnar ledger.Ledger (amounts in cents, no string parsing)."""
+        return Ledger.from_strings(self.transaction_history)
+
     def get_savings_balance(self):
         """Return balance plus accrued interest (not applied)."""
         return self.balance + self.compute_savings_interest()
 
-    def deposit(self, amount, note=""):
-        try:
-            amt = float(amount)
-        except Exception:
-            return False
-        if amt <= 0:
+    def deposit(self, amount, note="", save=True):
+        amt = parse_amount(amount)
+        if amt is None or not valid_note(note):
             return False
-        self.balance += amt
         entry = f"Deposited {amt:.2f}"
         if note:
             entry += f" - {note}"
-        self.transaction_history.append(entry)
-        return self.save_data()
 
-    def withdraw(self, amount, note=""):
-        try:
-            amt = float(amount)
-        except Exception:
-            return False
-        if amt <= 0 or amt > self.balance:
+        def change(account):
+            account.balance += amt
+            account.transaction_history.append(entry)
+            return entry
+        # save=False applies the change in memory only (see save_all)
+        return self._apply_change(change, save)
+
+    def withdraw(self, amount, note="", save=True):
+        amt = parse_amount(amount)
+        if amt is None or not valid_note(note):
             return False
-        self.balance -= amt
         entry = f"Withdrew {amt:.2f}"
         if note:
             entry += f" - {note}"
-        self.transaction_history.append(entry)
-        return self.save_data()
 
-    def transfer(self, target_username, amount, note=""):
-        try:
-            amt = float(amount)
-        except Exception:
-            return False
-        if amt <= 0 or amt > self.balance:
+        def change(account):
+            if amt > account.balance:
+                return False
+            account.balance -= amt
+            account.transaction_history.append(entry)
+            return entry
+        # save=False applies the change in memory only (see save_all)
+        return self._apply_change(change, save)
+
+    def transfer(self, target_username, amount, note="", save=True):
+        amt = parse_amount(amount)
+        if amt is None or not valid_note(note) or not valid_username(target_username):
             return False
-        self.balance -= amt
         entry = f"Transferred {amt:.2f} to {target_username}"
         if note:
             entry += f" - {note}"
-        self.transaction_history.append(entry)
-        return self.save_data()
\ No newline at end of file
+
+        def change(account):
+            if amt > account.balance:
+                return False
+            account.balance -= amt
+            account.transaction_history.append(entry)
+            return entry
+        # save=False applies the change in memory only (see save_all)
+        return self._apply_change(change, save)
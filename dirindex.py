@@ -0,0 +1,141 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Username -> account file index for one directory.
+         Data used to try five filename variants per lookup and open each one,
+         most of them failing with FileNotFoundError. The index lists the
+         directory once with os.scandir and answers "which of these names
+         exist" from memory, including "none of them" for unknown usernames.
+         It is rebuilt when the directory mtime changes; the mtime is checked
+         at most once per recheck interval, and saves made through Data are
+         added straight away. A file another process created since the last
+         listing changes the directory mtime, so when none of the asked
+         names is listed the mtime is checked again (one stat, whatever the
+         number of names) and the directory re-listed if it changed.
+"""
+import os
+import threading
+import time
+
+# every filename variant Data tries starts with this and ends with SUFFIX
+PREFIX = "encrypted"
+SUFFIX = ".txt"
+RECHECK_INTERVAL = 1.0
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(directory=None):
+    """Shared DirectoryIndex for directory (default: the current directory)."""
+    path = os.path.abspath(directory or os.getcwd())
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = DirectoryIndex(path)
+        return index
+
+
+class DirectoryIndex:
+    """
+    Set of account filenames present in one directory.
+    existing(filenames) -> the given names that exist, in order
+    add(filename) / discard(filename) keep it in step with our own writes
+    """
+    def __init__(self, directory=".", recheck_interval=RECHECK_INTERVAL):
+        self.directory = directory
+        self.recheck_interval = recheck_interval
+        self._names = set()
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _build(self):
+        names = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(PREFIX) and entry.name.endswith(SUFFIX):
+                    names.add(entry.name)
+        self._names = names
+
+    def _refresh(self, force=False):
+        """
+        Rebuild if the directory changed since the last listing. The mtime is
+        checked at most once per interval unless force is set.
+        Returns True if the listing was rebuilt.
+        """
+        now = time.monotonic()
+        if not force and self._mtime is not None and now - self._checked < self.recheck_interval:
+            return False
+        with self._lock:
+            try:
+                mtime = os.stat(self.directory).st_mtime_ns
+            except FileNotFoundError:
+                self._names, self._mtime = set(), None
+                return False
+            self._checked = now
+            if mtime == self._mtime:
+                return False
+            self._build()
+            self._mtime = mtime
+            return True
+
+    def invalidate(self):
+        """Force a fresh listing on the next lookup."""
+        self._mtime = None
+
+    def _local_name(self, filename):
+        """Return the bare name if filename is one this index lists, else None."""
+        head, tail = os.path.split(filename)
+        if not (tail.startswith(PREFIX) and tail.endswith(SUFFIX)):
+            return None
+        if head and os.path.abspath(head) != self.directory:
+            return None
+        return tail
+
+    def exists(self, filename):
+        """Answered from the listing; call after existing() to see the same listing."""
+        local = self._local_name(filename)
+        if local is None:
+            return os.path.exists(filename)
+        self._refresh()
+        return local in self._names
+
+    def existing(self, filenames):
+        """
+        The filenames (in the given order, without duplicates) that exist.
+        Names outside this directory cannot be answered from the listing and are
+        passed through for the caller to try. If none of the others is listed,
+        the directory is re-listed first if it changed since the last listing.
+        """
+        self._refresh()
+        candidates = []
+        for filename in filenames:
+            if filename not in candidates:
+                candidates.append(filename)
+        local_names = [self._local_name(filename) for filename in candidates]
+        names = self._names
+        if not any(local in names for local in local_names if local is not None):
+            if any(local is not None for local in local_names) and self._refresh(force=True):
+                names = self._names
+        return [filename for filename, local in zip(candidates, local_names)
+                if local is None or local in names]
+
+    def names(self):
+        """Every indexed filename in the directory, sorted."""
+        self._refresh()
+        return sorted(self._names)
+
+    def add(self, filename):
+        """Record a file we just wrote, without waiting for the next listing."""
+        local = self._local_name(filename)
+        if local is None:
+            return
+        with self._lock:
+            self._names.add(local)
+
+    def discard(self, filename):
+        local = self._local_name(filename)
+        if local is not None:
+            with self._lock:
+                self._names.discard(local)
@@ -3,21 +3,187 @@ author : Leo L. and Jeff J.
 date   : oct 30
 desc   : Simple rotor-like encryptor that generates a deterministic permutation
          from a random seed. The seed is prepended to the ciphertext as
-         "seed:..." so decrypt can reconstruct the mapping without external files.
+         "v1:seed:..." so decrypt can reconstruct the mapping without external
+         files; the "v1" tag names the alphabet, so the right decoder is picked
+         straight from the header. Old unversioned "seed:..." text still decrypts.
          The module provides Encrypt.encrypt(plaintext) -> ciphertext and
          Encrypt.decrypt(ciphertext) -> plaintext.
+         Permutations are compiled into str.translate tables. Decrypt tables
+         are kept in a small LRU cache keyed by (seed, alphabet version), so
+         reading the same account again does not reshuffle; encrypt picks a
+         fresh seed every time, so its table is built and dropped.
+         encrypt_many / decrypt_many handle whole batches (decrypt_many
+         grouped by seed), optionally spread over a process pool.
+         encrypt_stream / decrypt_stream work on iterables of chunks so big
+         account files never have to be held in memory as one string.
 """
 import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# alphabet versions: 1 is printable ASCII, 0 is the legacy A..Z + symbols set
+ALPHABET_CURRENT = 1
+ALPHABET_LEGACY = 0
+ALPHABETS = {
+    ALPHABET_CURRENT: tuple(chr(i) for i in range(32, 127)),
+    ALPHABET_LEGACY: tuple([chr(i) for i in range(65, 91)] + [",", ".", "!", "/", "?", "#", "$", "%", "^", "&", "*", "(", ")", "-", "_", "=", "+"]),
+}
+
+# ciphertext header: "v<alphabet version>:seed:payload"
+FORMAT_MARKER = "v"
+FORMAT_VERSION = ALPHABET_CURRENT
+
+# how many (seed, version) decrypt tables to keep around (about 5 KB each)
+TABLE_CACHE_SIZE = 256
+# default number of items handed to one worker task in the batch APIs
+BATCH_CHUNK_SIZE = 256
+# characters read per chunk by the streaming helpers
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _permutation(seed: int, version: int):
+    """
+    (alphabet, shuffled alphabet) for one seed, as strings.
+    The shuffle is exactly the one the per-character code used, so the
+    ciphertext is unchanged; characters outside the alphabet pass through.
+    """
+    alphabet = ALPHABETS[version]
+    rng = random.Random(seed)
+    perm = list(alphabet)
+    rng.shuffle(perm)
+    return "".join(alphabet), "".join(perm)
+
+
+def _encrypt_table(seed: int, version: int):
+    """str.translate table that encrypts with seed (not cached: seeds are one-off)."""
+    alphabet, perm = _permutation(seed, version)
+    return str.maketrans(alphabet, perm)
+
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _decrypt_table(seed: int, version: int):
+    """str.translate table that decrypts text encrypted with seed."""
+    alphabet, perm = _permutation(seed, version)
+    return str.maketrans(perm, alphabet)
+
+
+def _split_header(ciphertext: str):
+    """
+    Split "v<version>:seed:payload" or the unversioned "seed:payload".
+    Returns (version or None, seed, payload). Raises ValueError when malformed.
+    """
+    if ciphertext.startswith(FORMAT_MARKER):
+        tag, seed_str, encoded = ciphertext.split(":", 2)
+        version = int(tag[len(FORMAT_MARKER):])
+        if version not in ALPHABETS:
+            raise ValueError(f"unknown format version {version}")
+        return version, int(seed_str), encoded
+    seed_str, encoded = ciphertext.split(":", 1)
+    return None, int(seed_str), encoded
+
+
+def header_version(ciphertext: str):
+    """Return the alphabet version named in the header, or None if unversioned/malformed."""
+    try:
+        return _split_header(ciphertext)[0]
+    except Exception:
+        return None
+
+
+# whitespace trimmed from the end of stored payloads; a space is a valid
+# ciphertext character, so trailing spaces are kept
+TRAILING_WHITESPACE = "\r\n\t\x0b\x0c"
+
+
+def strip_payload(text):
+    """Trim a stored payload like str.strip(), but keep trailing spaces (they are ciphertext)."""
+    return text.lstrip().rstrip(TRAILING_WHITESPACE)
+
+
+def iter_file_chunks(f, chunk_size=None, strip=True):
+    """
+    Yield fixed-size chunks from an open text file.
+    With strip=True the whole file is trimmed like strip_payload, without
+    reading everything at once.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    started = False
+    pending = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        if not strip:
+            yield chunk
+            continue
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        # hold back trailing whitespace until we know it is not the end
+        chunk = pending + chunk
+        body = chunk.rstrip(TRAILING_WHITESPACE)
+        pending = chunk[len(body):]
+        if body:
+            yield body
+
+
+def _encrypt_chunk(items):
+    """
+    Worker for encrypt_many. items is a list of (index, seed, plaintext).
+    Returns a list of (index, ciphertext, error).
+    """
+    out = []
+    for index, seed, plaintext in items:
+        try:
+            forward = _encrypt_table(seed, FORMAT_VERSION)
+            out.append((index, f"{FORMAT_MARKER}{FORMAT_VERSION}:{seed}:{plaintext.translate(forward)}", None))
+        except Exception as e:
+            out.append((index, "", f"encrypt failed: {e}"))
+    return out
+
+
+def _decrypt_chunk(items):
+    """
+    Worker for decrypt_many. items is a list of (index, version, seed, payload)
+    that already passed header parsing. Returns a list of (index, plaintext, error).
+    """
+    out = []
+    for index, version, seed, encoded in items:
+        try:
+            reverse = _decrypt_table(seed, version)
+            out.append((index, encoded.translate(reverse), None))
+        except Exception as e:
+            out.append((index, "", f"decrypt failed: {e}"))
+    return out
+
+
+def _run_chunks(func, items, workers, chunk_size):
+    """
+    Split items into chunks and run func over them, in a process pool when
+    workers > 1. Yields the per-item result tuples of every chunk.
+    """
+    chunk_size = max(1, int(chunk_size or BATCH_CHUNK_SIZE))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if not workers or workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(func, chunks):
+            yield from result
+
 
 class Encrypt:
     """
-    Simple rotor-like encryptor using a random seed header "seed:payload".
-    encrypt(plaintext) -> "seed:encoded"
+    Simple rotor-like encryptor using a random seed header "v1:seed:payload".
+    encrypt(plaintext) -> "v1:seed:encoded"
     decrypt(ciphertext) -> plaintext or "" on failure
     """
     def __init__(self):
         # printable ASCII from space (32) to tilde (126)
-        self.alphabet = [chr(i) for i in range(32, 127)]
+        self.alphabet = list(ALPHABETS[ALPHABET_CURRENT])
         self.n = len(self.alphabet)
 
     def _perm_from_seed(self, seed: int):
@@ -28,22 +194,18 @@ class Encrypt:
 
     def encrypt(self, plaintext: str) -> str:
         seed = random.randint(0, 2**31 - 1)
-        perm = self._perm_from_seed(seed)
-        mapping = {self.alphabet[i]: perm[i] for i in range(self.n)}
-        encoded = ''.join(mapping.get(ch, ch) for ch in plaintext)
-        return f"{seed}:{encoded}"
+        forward = _encrypt_table(seed, FORMAT_VERSION)
+        return f"{FORMAT_MARKER}{FORMAT_VERSION}:{seed}:{plaintext.translate(forward)}"
 
     def decrypt(self, ciphertext: str) -> str:
-        # expect "seed:payload"
+        # expect "v1:seed:payload"; unversioned "seed:payload" uses the current alphabet
         try:
-            seed_str, encoded = ciphertext.split(":", 1)
-            seed = int(seed_str)
+            version, seed, encoded = _split_header(ciphertext)
         except Exception:
             return ""
         try:
-            perm = self._perm_from_seed(seed)
-            reverse = {perm[i]: self.alphabet[i] for i in range(self.n)}
-            return ''.join(reverse.get(ch, ch) for ch in encoded)
+            reverse = _decrypt_table(seed, ALPHABET_CURRENT if version is None else version)
+            return encoded.translate(reverse)
         except Exception:
             return ""
 
@@ -51,19 +213,105 @@ class Encrypt:
     def decrypt_old(self, ciphertext: str) -> str:
         """
         Attempt decrypt using the legacy alphabet (A..Z + symbols).
+        A versioned header always wins over the guess.
         Returns plaintext or empty string on failure.
         """
         try:
-            seed_str, encoded = ciphertext.split(":", 1)
-            seed = int(seed_str)
+            version, seed, encoded = _split_header(ciphertext)
+        except Exception:
+            return ""
+        try:
+            reverse = _decrypt_table(seed, ALPHABET_LEGACY if version is None else version)
+            return encoded.translate(reverse)
         except Exception:
             return ""
-        OLD_ALPHABET = [chr(i) for i in range(65, 91)] + [",", ".", "!", "/", "?", "#", "$", "%", "^", "&", "*", "(", ")", "-", "_", "=", "+"]
+
+    def encrypt_many(self, plaintexts, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        Encrypt a batch of plaintexts.
+        Returns a list of (ciphertext, error) in input order; error is None on
+        success, otherwise a message and ciphertext is "".
+        workers > 1 spreads the chunks over a process pool.
+        """
+        plaintexts = list(plaintexts)
+        results = [None] * len(plaintexts)
+        items = []
+        for index, plaintext in enumerate(plaintexts):
+            if not isinstance(plaintext, str):
+                results[index] = ("", f"expected str, got {type(plaintext).__name__}")
+                continue
+            items.append((index, random.randint(0, 2**31 - 1), plaintext))
+        for index, text, error in _run_chunks(_encrypt_chunk, items, workers, chunk_size):
+            results[index] = (text, error)
+        return results
+
+    def decrypt_many(self, ciphertexts, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        Decrypt a batch of "v1:seed:payload" (or unversioned "seed:payload") strings.
+        Payloads are grouped by seed so each translation table is built once
+        per chunk. Returns a list of (plaintext, error) in input order; error is
+        None on success, otherwise a message and plaintext is "".
+        workers > 1 spreads the chunks over a process pool.
+        """
+        ciphertexts = list(ciphertexts)
+        results = [None] * len(ciphertexts)
+        items = []
+        for index, ciphertext in enumerate(ciphertexts):
+            try:
+                version, seed, encoded = _split_header(ciphertext)
+            except Exception:
+                results[index] = ("", "malformed header, expected v1:seed:payload")
+                continue
+            items.append((index, ALPHABET_CURRENT if version is None else version, seed, encoded))
+        items.sort(key=lambda item: (item[1], item[2]))
+        for index, text, error in _run_chunks(_decrypt_chunk, items, workers, chunk_size):
+            results[index] = (text, error)
+        return results
+
+    def encrypt_stream(self, chunks):
+        """
+        Encrypt an iterable of plaintext chunks.
+        Yields the "v1:seed:" header first and then one ciphertext chunk per
+        input chunk, so "".join(result) is the same shape as encrypt(plaintext).
+        """
+        seed = random.randint(0, 2**31 - 1)
+        forward = _encrypt_table(seed, FORMAT_VERSION)
+        yield f"{FORMAT_MARKER}{FORMAT_VERSION}:{seed}:"
+        for chunk in chunks:
+            if chunk:
+                yield chunk.translate(forward)
+
+    def decrypt_stream(self, chunks, version=ALPHABET_CURRENT):
+        """
+        Decrypt an iterable of ciphertext chunks (the header may be split anywhere).
+        Yields plaintext chunks; yields nothing if the header is malformed.
+        version is the alphabet for unversioned input (ALPHABET_LEGACY mirrors
+        decrypt_old); a "v<n>:" header always wins.
+        """
+        chunks = iter(chunks)
+        head = ""
+        for chunk in chunks:
+            head += chunk
+            needed = 2 if head.startswith(FORMAT_MARKER) else 1
+            if head.count(":", 0, 48) >= needed:
+                break
+            # a header is at most a handful of characters, anything longer is junk
+            if len(head) > 48:
+                return
         try:
-            rng = random.Random(seed)
-            perm = OLD_ALPHABET.copy()
-            rng.shuffle(perm)
-            rev = {perm[i]: OLD_ALPHABET[i] for i in range(len(OLD_ALPHABET))}
-            return ''.join(rev.get(ch, ch) for ch in encoded)
+            tagged, seed, encoded = _split_header(head)
+            reverse = _decrypt_table(seed, version if tagged is None else tagged)
         except Exception:
-            return ""
\ No newline at end of file
+            return
+        if encoded:
+            yield encoded.translate(reverse)
+        for chunk in chunks:
+            if chunk:
+                yield chunk.translate(reverse)
+
+    def encrypt_to_file(self, chunks, f):
+        """Encrypt plaintext chunks straight into an open file. Returns chars written."""
+        written = 0
+        for piece in self.encrypt_stream(chunks):
+            written += f.write(piece)
+        return written
@@ -6,8 +6,12 @@ desc   : Tkinter GUI for account manager/encryption demo.
        - Base_page: main application class with views for login, register,
          account choosing, saving/checking, transfer, withdraw, deposit.
        Comments describe intent of major UI builders and helper functions.
+       Loading and saving accounts runs on a TaskRunner (tasks.py) so the
+       window keeps redrawing; the results come back to the Tk thread.
 """
-from data import Data
+from data import Data, update_account
+from tasks import TaskRunner
+from transfer import TransferEngine
 import tkinter as tk
 import tkinter.messagebox as messagebox
 import time
@@ -76,6 +80,9 @@ class Base_page:
     def __init__(self, root, manager=None):
         self.main_win = root
         self.manager = manager
+        self.transfers = TransferEngine(encrypt_manager=manager)
+        # file and cipher work runs here, off the Tk thread
+        self.tasks = TaskRunner(root)
         self.main_win.config(bg="#fde6a3")
         self.last_page = None
         current_time_struct = time.localtime()
@@ -246,10 +253,6 @@ class Base_page:
 
         # check uniqueness: try to load existing file (use consistent underscore template)
         check = Data(username=username, encrypt_manager=self.manager, filename_template="encrypted_{username}.txt")
-        exists = check.pull_data(username)
-        if exists:
-            messagebox.showerror("Registration Failed", "That username already exists. Pick another.")
-            return
 
         # generate simple account number
         import random
@@ -263,12 +266,30 @@ class Base_page:
 
         d.transaction_history.append(f"Account created at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
 
-        ok = d.save_data()
-        if ok:
-            messagebox.showinfo("Registration Successful", f"{username} has been created\nAccount #: {account_number}")
-            self.back_main()
-        else:
-            messagebox.showerror("Registration Failed", "Could not create account.")
+        def create():
+            # worker thread: no Tk calls here
+            if check.pull_data(username):
+                return "exists"
+            # checked save: fails instead of overwriting an account registered meanwhile
+            if d.save_data(check_revision=True):
+                return "ok"
+            return "exists" if check.pull_data(username) else "failed"
+
+        def done(status):
+            if status == "exists":
+                messagebox.showerror("Registration Failed", "That username already exists. Pick another.")
+            elif status == "ok":
+                messagebox.showinfo("Registration Successful", f"{username} has been created\nAccount #: {account_number}")
+                self.back_main()
+            else:
+                messagebox.showerror("Registration Failed", "Could not create account.")
+
+        self.tasks.submit(create, on_done=done, on_error=self.task_failed,
+                          disable=[getattr(self, "register_button", None)], message="Creating account")
+
+    def task_failed(self, error):
+        """Shown when a background task raised instead of returning."""
+        messagebox.showerror("Error", f"Something went wrong: {error}")
 
     def save_check(self):
         """Show account chooser (saving/checking) after login. Show account info and change-password."""
@@ -344,7 +365,9 @@ class Base_page:
         if not ok:
             messagebox.showerror("Failed", msg)
             return
-        self.current_data.change_password(new)
+        if not self.current_data.change_password(new):
+            messagebox.showerror("Failed", "Could not save the new password.")
+            return
         messagebox.showinfo("Success", "Password changed.")
         self.save_check()
 
@@ -462,6 +485,7 @@ class Base_page:
 
     def quiting(self):
         """Close the application window and quit mainloop."""
+        self.tasks.shutdown()
         self.main_win.quit()
         self.main_win.destroy()
         
@@ -559,35 +583,32 @@ class Base_page:
             messagebox.showerror("Transfer Failed", "Insufficient funds.")
             return
 
-        # use underscore filename template for target
-        target = Data(username=target_username, encrypt_manager=self.manager, filename_template="encrypted_{username}.txt")
-        ok = target.pull_data(target_username)
-        if not ok:
-            messagebox.showerror("Transfer Failed", "Target account not found.")
-            return
-
+        # debit and credit are locked and saved together by the transfer engine
+        username = self.current_data.username
         note = f"Transfer to {target_username} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
-        ok1 = self.current_data.transfer(target_username, amount, note=note)
-        if not ok1:
-            messagebox.showerror("Transfer Failed", "Could not withdraw from current account.")
-            return
-
-        note_target = f"Received from {self.current_data.username} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
-        ok2 = target.deposit(amount, note=note_target)
-        if not ok2:
-            # rollback
-            self.current_data.deposit(amount, note=f"Rollback of failed transfer to {target_username}")
-            messagebox.showerror("Transfer Failed", "Could not credit target account. Transfer rolled back.")
-            return
+        note_target = f"Received from {username} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        current = self.current_data
+
+        def run_transfer():
+            ok, message = self.transfers.transfer(username, target_username, amount, note=note, note_target=note_target)
+            # pick up the balance the engine saved (served from the account cache)
+            return ok, message, self.reload_account(current) if ok else None
+
+        def done(result):
+            ok, message, fresh = result
+            if not ok:
+                messagebox.showerror("Transfer Failed", message)
+                return
+            messagebox.showinfo("Transfer Successful", f"Transferred {amount:.2f} to {target_username}.")
+            try:
+                self.transfer_frame.pack_forget()
+            except Exception:
+                pass
+            self.swap_account(current, fresh)
 
-        messagebox.showinfo("Transfer Successful", f"Transferred {amount:.2f} to {target_username}.")
+        self.tasks.submit(run_transfer, on_done=done, on_error=self.task_failed,
+                          disable=[getattr(self, "confirm_transfer", None)], message="Transferring")
 
-        try:
-            self.transfer_frame.pack_forget()
-        except Exception:
-            pass
-        self.checking_account(self.current_data.balance)
-        
     def withdraw(self):
         """Show withdraw UI. Ensure controls are packed and visible."""
         try:
@@ -659,6 +680,37 @@ class Base_page:
         self.last_page = self.deposit_frame
 
     # Ensure start handlers exist and persist changes
+    def reload_account(self, current):
+        """
+        Worker thread: load current's account into a new Data, leaving current
+        (still shown by the Tk thread) untouched. Returns None if it can't load.
+        """
+        fresh = Data(username=current.username, encrypt_manager=current.manager,
+                     filename_template=current.filename_template, store=current.store)
+        return fresh if fresh.pull_data(current.username) else None
+
+    def swap_account(self, current, fresh):
+        """
+        Tk thread: replace current with the copy loaded by reload_account and
+        show its balance; nothing changes if the user logged out meanwhile.
+        """
+        if getattr(self, "current_data", None) is not current:
+            return
+        if fresh is not None:
+            self.current_data = fresh
+        self.checking_account(self.current_data.balance)
+
+    def apply_change(self, current, method, amount, note):
+        """
+        Worker thread: deposit or withdraw on the stored account, redone on a
+        fresh copy if another window or process saved it meanwhile.
+        Returns (ok, reloaded account) for swap_account.
+        """
+        ok, _, _ = update_account(current.username, lambda a: getattr(a, method)(amount, note, save=False),
+                                  encrypt_manager=current.manager, filename_template=current.filename_template,
+                                  store=current.store)
+        return ok, self.reload_account(current)
+
     def start_withdraw(self):
         amt = getattr(self, "withdraw_enter", tk.Entry()).get().strip()
         try:
@@ -669,16 +721,24 @@ class Base_page:
         if not hasattr(self, "current_data") or self.current_data is None:
             messagebox.showerror("Error", "No account loaded.")
             return
-        ok = self.current_data.withdraw(amount, note=f"ATM withdraw at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        if ok:
-            messagebox.showinfo("Success", f"Withdrew {amount:.2f}")
-        else:
-            messagebox.showerror("Failed", "Insufficient funds or invalid amount.")
-        try:
-            self.withdraw_frame.pack_forget()
-        except Exception:
-            pass
-        self.checking_account(self.current_data.balance)
+        current = self.current_data
+
+        def done(result):
+            ok, fresh = result
+            if ok:
+                messagebox.showinfo("Success", f"Withdrew {amount:.2f}")
+            else:
+                messagebox.showerror("Failed", "Insufficient funds or invalid amount.")
+            try:
+                self.withdraw_frame.pack_forget()
+            except Exception:
+                pass
+            self.swap_account(current, fresh)
+
+        note = f"ATM withdraw at {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        self.tasks.submit(self.apply_change, current, "withdraw", amount, note, on_done=done, on_error=self.task_failed,
+                          disable=[getattr(self, "withdraw_confirm", None), getattr(self, "withdraw_back", None)],
+                          message="Withdrawing")
 
     def start_deposit(self):
         amt = getattr(self, "deposit_enter", tk.Entry()).get().strip()
@@ -690,16 +750,24 @@ class Base_page:
         if not hasattr(self, "current_data") or self.current_data is None:
             messagebox.showerror("Error", "No account loaded.")
             return
-        ok = self.current_data.deposit(amount, note=f"ATM deposit at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        if ok:
-            messagebox.showinfo("Success", f"Deposited {amount:.2f}")
-        else:
-            messagebox.showerror("Failed", "Invalid amount.")
-        try:
-            self.deposit_frame.pack_forget()
-        except Exception:
-            pass
-        self.checking_account(self.current_data.balance)
+        current = self.current_data
+
+        def done(result):
+            ok, fresh = result
+            if ok:
+                messagebox.showinfo("Success", f"Deposited {amount:.2f}")
+            else:
+                messagebox.showerror("Failed", "Invalid amount.")
+            try:
+                self.deposit_frame.pack_forget()
+            except Exception:
+                pass
+            self.swap_account(current, fresh)
+
+        note = f"ATM deposit at {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        self.tasks.submit(self.apply_change, current, "deposit", amount, note, on_done=done, on_error=self.task_failed,
+                          disable=[getattr(self, "deposit_confirm", None), getattr(self, "back_to_accounts", None)],
+                          message="Depositing")
 
     def logging(self):
         """
@@ -720,26 +788,36 @@ class Base_page:
         # use consistent underscore filename template when creating Data for login
         d = Data(username=username, encrypt_manager=self.manager, filename_template="encrypted_{username}.txt")
 
-        # quick check for existence/decryptability
-        payload, fname = d.find_encrypted_payload(username)
-        if not payload:
-            messagebox.showerror("Login failed", "Username not found.")
-            return
-
-        # now try to fully load
-        ok = d.pull_data(username)
-        if not ok:
-            messagebox.showerror("Login failed", "Account data corrupt.")
-            return
-
-        # check password
-        if d.password != password:
-            messagebox.showerror("Login failed", "Incorrect password.")
-            return
-
-        # success
-        self.current_data = d
-        self.show_account_home()
+        def load():
+            # worker thread: no Tk calls here
+            # load straight away (one streamed read, or none if cached); only a
+            # failed load needs the lookup that tells a missing account from a corrupt one
+            if d.pull_data(username):
+                return "ok"
+            if not d.find_encrypted_payload(username)[0]:
+                return "missing"
+            return "corrupt"
+
+        def done(status):
+            if status == "missing":
+                messagebox.showerror("Login failed", "Username not found.")
+                return
+            if status == "corrupt":
+                messagebox.showerror("Login failed", "Account data corrupt.")
+                return
+
+            # check password
+            if d.password != password:
+                messagebox.showerror("Login failed", "Incorrect password.")
+                return
+
+            # success
+            self.current_data = d
+            self.show_account_home()
+
+        self.tasks.submit(load, on_done=done, on_error=self.task_failed,
+                          disable=[getattr(self, "login", None), getattr(self, "create_account", None)],
+                          message="Logging in")
 
     def show_account_home(self):
         """
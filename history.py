@@ -0,0 +1,192 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Lazily parsed transaction history.
+         An account file stores its history as one ";"-joined string. Loading
+         used to split it into a list straight away, even for a login that
+         only needs the balance. LazyHistory keeps the joined text and only
+         cuts out the entries that are actually read:
+           len()              counted once, no strings built
+           reversed(), page() walk from the nearest end with find/rfind
+           append()           goes to a small tail list
+           save               the loaded text is written back as is
+         Anything that edits existing entries (del, insert, item assignment)
+         splits the text into a plain list once and works on that.
+"""
+from collections.abc import MutableSequence
+
+SEPARATOR = ";"
+
+
+class LazyHistory(MutableSequence):
+    """
+    Sequence of transaction strings backed by the ";"-joined text they were
+    loaded from. Behaves like a list.
+    """
+    def __init__(self, text=""):
+        # loaded part, either still joined (_text) or split (_items)
+        self._text = text
+        self._count = None
+        self._items = None
+        # entries appended since loading, while _text is still joined
+        self._tail = []
+
+    @property
+    def parsed(self):
+        """True once the loaded text has been split into a list."""
+        return self._items is not None
+
+    def _text_count(self):
+        if self._count is None:
+            self._count = self._text.count(SEPARATOR) + 1 if self._text else 0
+        return self._count
+
+    def _split(self):
+        """Switch to a plain list; needed before editing existing entries."""
+        if self._items is None:
+            self._items = self._text.split(SEPARATOR) if self._text else []
+            self._items.extend(self._tail)
+            self._text = None
+            self._tail = []
+        return self._items
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return self._text_count() + len(self._tail)
+
+    def _scan(self, start, stop):
+        """Entries start..stop-1 of the joined text, found from whichever end is closer."""
+        text = self._text
+        count = self._text_count()
+        if start >= stop:
+            return []
+        if start < count - stop:
+            pos = 0
+            for _ in range(start):
+                pos = text.find(SEPARATOR, pos) + 1
+            out = []
+            for _ in range(stop - start):
+                end = text.find(SEPARATOR, pos)
+                if end < 0:
+                    end = len(text)
+                out.append(text[pos:end])
+                pos = end + 1
+            return out
+        end = len(text)
+        for _ in range(count - stop):
+            end = text.rfind(SEPARATOR, 0, end)
+        out = []
+        for _ in range(stop - start):
+            pos = text.rfind(SEPARATOR, 0, end) + 1
+            out.append(text[pos:end])
+            end = pos - 1
+        out.reverse()
+        return out
+
+    def page(self, offset, limit, newest_first=False):
+        """
+        Up to limit entries starting offset entries in, oldest first (or
+        counted from the newest entry with newest_first=True).
+        """
+        total = len(self)
+        if newest_first:
+            stop = max(0, total - max(0, offset))
+            start = max(0, stop - max(0, limit))
+        else:
+            start = min(total, max(0, offset))
+            stop = min(total, start + max(0, limit))
+        if self._items is not None:
+            out = self._items[start:stop]
+        else:
+            count = self._text_count()
+            out = self._scan(start, min(stop, count))
+            out.extend(self._tail[max(0, start - count):max(0, stop - count)])
+        if newest_first:
+            out.reverse()
+        return out
+
+    def __getitem__(self, index):
+        if self._items is not None:
+            return self._items[index]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.page(start, stop - start)
+            return self._split()[index]
+        total = len(self)
+        if index < 0:
+            index += total
+        if not 0 <= index < total:
+            raise IndexError("history index out of range")
+        return self.page(index, 1)[0]
+
+    def __setitem__(self, index, value):
+        self._split()[index] = value
+
+    def __delitem__(self, index):
+        del self._split()[index]
+
+    def insert(self, index, value):
+        self._split().insert(index, value)
+
+    def append(self, value):
+        if self._items is not None:
+            self._items.append(value)
+        else:
+            self._tail.append(value)
+
+    def __iter__(self):
+        if self._items is not None:
+            yield from self._items
+            return
+        text = self._text
+        if text:
+            pos = 0
+            while True:
+                end = text.find(SEPARATOR, pos)
+                if end < 0:
+                    yield text[pos:]
+                    break
+                yield text[pos:end]
+                pos = end + 1
+        yield from self._tail
+
+    def __reversed__(self):
+        if self._items is not None:
+            yield from reversed(self._items)
+            return
+        yield from reversed(self._tail)
+        text = self._text
+        if text:
+            end = len(text)
+            while True:
+                pos = text.rfind(SEPARATOR, 0, end)
+                yield text[pos + 1:end]
+                if pos < 0:
+                    break
+                end = pos
+
+    def iter_joined(self, batch_size=512):
+        """
+        The history as ";"-joinable pieces for saving: the loaded text as one
+        piece (never split), then the appended entries in batches.
+        """
+        if self._items is not None:
+            items = self._items
+            for start in range(0, len(items), batch_size):
+                yield SEPARATOR.join(items[start:start + batch_size])
+            return
+        if self._text:
+            yield self._text
+        tail = self._tail
+        for start in range(0, len(tail), batch_size):
+            yield SEPARATOR.join(tail[start:start + batch_size])
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyHistory, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"LazyHistory({list(self)!r})"
@@ -0,0 +1,167 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : On-disk store for MultiAccountEncrypt keys.
+         Every account's key is kept already compiled (the index tables from
+         MultiAccountEncrypt.compile_key) in one binary file that is opened
+         with mmap, so start-up only reads a fixed-size header and each key is
+         read the first time its account is used.
+
+         Layout (little endian):
+           header  : magic, alphabet size, slot count, record count, end offset
+           slots   : slot_count x uint64 record offsets (0 = empty), open
+                     addressing on crc32(name) with linear probing
+           records : uint16 name length, name (utf-8), then the six tables
+                     plug, r1, r1_inv, r2, r2_inv, ref as n bytes each
+"""
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b"MAEKEYS1"
+HEADER = struct.Struct("<8sHHIQQ")  # magic, n, reserved, slot_count, record_count, end
+SLOT = struct.Struct("<Q")
+NAME_LEN = struct.Struct("<H")
+TABLE_NAMES = ("plug", "r1", "r1_inv", "r2", "r2_inv", "ref")
+DEFAULT_SLOTS = 1024
+# grow the slot table once it is this full
+MAX_LOAD = 0.5
+
+
+class KeyStore:
+    """
+    Memory-mapped store of compiled rotor keys.
+    get(name) -> dict of the six index tables or None
+    put(name, compiled) stores/overwrites the tables for name
+    """
+    def __init__(self, path="keystore.bin", alphabet_size=43):
+        self.path = path
+        self.n = alphabet_size
+        self.record_size = len(TABLE_NAMES) * self.n
+        self._file = None
+        self._map = None
+        if not os.path.exists(path):
+            self._create(path, DEFAULT_SLOTS)
+        self._open()
+
+    def _create(self, path, slot_count, records=()):
+        """Write an empty store with slot_count slots, then append records (name, blob)."""
+        table_end = HEADER.size + slot_count * SLOT.size
+        slots = [0] * slot_count
+        body = bytearray()
+        for name, blob in records:
+            raw = name.encode("utf-8")
+            offset = table_end + len(body)
+            body += NAME_LEN.pack(len(raw)) + raw + blob
+            i = zlib.crc32(raw) & (slot_count - 1)
+            while slots[i]:
+                i = (i + 1) & (slot_count - 1)
+            slots[i] = offset
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.n, 0, slot_count, len(records), table_end + len(body)))
+            f.write(b"".join(SLOT.pack(s) for s in slots))
+            f.write(body)
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, _, self.slot_count, self.count, self.end = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a key store")
+        if n != self.n:
+            raise ValueError(f"{self.path} holds keys for a {n}-letter alphabet, expected {self.n}")
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self._find(name.encode("utf-8"))[1] is not None
+
+    def _find(self, raw):
+        """Probe for raw name. Returns (slot index, record offset or None)."""
+        mask = self.slot_count - 1
+        i = zlib.crc32(raw) & mask
+        while True:
+            (offset,) = SLOT.unpack_from(self._map, HEADER.size + i * SLOT.size)
+            if offset == 0:
+                return i, None
+            (length,) = NAME_LEN.unpack_from(self._map, offset)
+            start = offset + NAME_LEN.size
+            if self._map[start:start + length] == raw:
+                return i, offset
+            i = (i + 1) & mask
+
+    def get(self, name):
+        """Return the compiled tables for name as a dict of lists, or None."""
+        raw = name.encode("utf-8")
+        _, offset = self._find(raw)
+        if offset is None:
+            return None
+        start = offset + NAME_LEN.size + len(raw)
+        blob = self._map[start:start + self.record_size]
+        return {table: list(blob[i * self.n:(i + 1) * self.n]) for i, table in enumerate(TABLE_NAMES)}
+
+    def put(self, name, compiled):
+        """Store the compiled tables (as from compile_key) for name."""
+        raw = name.encode("utf-8")
+        blob = b"".join(bytes(compiled[table]) for table in TABLE_NAMES)
+        if len(blob) != self.record_size:
+            raise ValueError("compiled key does not match the store's alphabet size")
+        slot, offset = self._find(raw)
+        if offset is not None:
+            self._write_at(offset + NAME_LEN.size + len(raw), blob)
+            return
+        if (self.count + 1) > self.slot_count * MAX_LOAD:
+            self._grow(extra=(name, blob))
+            return
+        record = NAME_LEN.pack(len(raw)) + raw + blob
+        offset = self.end
+        self._write_at(offset, record, slot=(slot, offset), count=self.count + 1, end=offset + len(record))
+
+    def _write_at(self, offset, data, slot=None, count=None, end=None):
+        """Write data at offset (and optionally a slot and new header) then remap."""
+        self._map.close()
+        self._file.seek(offset)
+        self._file.write(data)
+        if slot is not None:
+            self._file.seek(HEADER.size + slot[0] * SLOT.size)
+            self._file.write(SLOT.pack(slot[1]))
+        if count is not None:
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, self.n, 0, self.slot_count, count, end))
+        self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if count is not None:
+            self.count, self.end = count, end
+
+    def items(self):
+        """Yield (name, blob) for every stored record, in file order."""
+        offset = HEADER.size + self.slot_count * SLOT.size
+        while offset < self.end:
+            (length,) = NAME_LEN.unpack_from(self._map, offset)
+            start = offset + NAME_LEN.size
+            name = self._map[start:start + length].decode("utf-8")
+            blob = self._map[start + length:start + length + self.record_size]
+            yield name, blob
+            offset = start + length + self.record_size
+
+    def _grow(self, extra):
+        """Rebuild the file with twice the slots, adding the extra (name, blob) record."""
+        records = list(self.items()) + [extra]
+        slot_count = self.slot_count * 2
+        while len(records) > slot_count * MAX_LOAD:
+            slot_count *= 2
+        tmp = self.path + ".tmp"
+        self._create(tmp, slot_count, records)
+        self.close()
+        os.replace(tmp, self.path)
+        self._open()
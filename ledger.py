@@ -0,0 +1,257 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Columnar transaction ledger.
+         transaction_history holds one free-form string per transaction and
+         every total has to re-parse the amounts. A Ledger keeps the same
+         transactions in typed arrays:
+             ops           operation code per entry (array "B")
+             cents         amount in integer cents (array "q")
+             timestamps    epoch seconds, 0 when unknown (array "q")
+             counterparty  index into the interned name table, -1 for none
+             notes         index into the interned note table, -1 for none
+         Conversion from the history strings is lossless: an entry is only
+         stored structured if formatting it again gives back the exact same
+         string, anything else is kept verbatim as an OP_OTHER note.
+
+             ledger = Ledger.from_strings(account.transaction_history)
+             ledger.total(OP_DEPOSIT)            # cents, no string parsing
+             list(ledger.to_strings()) == list(account.transaction_history)
+"""
+import re
+import time
+from array import array
+
+OP_OTHER = 0
+OP_DEPOSIT = 1
+OP_WITHDRAW = 2
+OP_TRANSFER = 3
+OP_CREATED = 4
+
+OP_NAMES = {
+    OP_OTHER: "other",
+    OP_DEPOSIT: "deposit",
+    OP_WITHDRAW: "withdraw",
+    OP_TRANSFER: "transfer",
+    OP_CREATED: "created",
+}
+# history verb for the operations that carry an amount
+OP_VERBS = {OP_DEPOSIT: "Deposited", OP_WITHDRAW: "Withdrew", OP_TRANSFER: "Transferred"}
+
+CREATED_PREFIX = "Account created at "
+CREATED_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_AMOUNT_RE = re.compile(r"(Deposited|Withdrew) (\d+)\.(\d\d)(?: - (.*))?\Z", re.S)
+_TRANSFER_RE = re.compile(r"Transferred (\d+)\.(\d\d) to (.*?)(?: - (.*))?\Z", re.S)
+_VERB_OPS = {"Deposited": OP_DEPOSIT, "Withdrew": OP_WITHDRAW}
+
+
+def format_cents(cents):
+    """1234 -> "12.34", the same text as f"{amount:.2f}"."""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def format_entry(op, cents=0, counterparty=None, note=None, timestamp=0):
+    """The history string for one transaction, as data.Data writes it."""
+    if op == OP_OTHER:
+        return note or ""
+    if op == OP_CREATED:
+        return CREATED_PREFIX + time.strftime(CREATED_FORMAT, time.localtime(timestamp))
+    text = f"{OP_VERBS[op]} {format_cents(cents)}"
+    if op == OP_TRANSFER:
+        text += f" to {counterparty}"
+    if note:
+        text += f" - {note}"
+    return text
+
+
+def parse_entry(text):
+    """
+    Split a history string into (op, cents, counterparty, note, timestamp).
+    Strings that would not format back identically come back as OP_OTHER.
+    """
+    parsed = None
+    m = _AMOUNT_RE.match(text)
+    if m:
+        parsed = (_VERB_OPS[m.group(1)], int(m.group(2)) * 100 + int(m.group(3)), None, m.group(4), 0)
+    else:
+        m = _TRANSFER_RE.match(text)
+        if m:
+            parsed = (OP_TRANSFER, int(m.group(1)) * 100 + int(m.group(2)), m.group(3), m.group(4), 0)
+        elif text.startswith(CREATED_PREFIX):
+            try:
+                stamp = int(time.mktime(time.strptime(text[len(CREATED_PREFIX):], CREATED_FORMAT)))
+                parsed = (OP_CREATED, 0, None, None, stamp)
+            except (ValueError, OverflowError):
+                parsed = None
+    if parsed is None or format_entry(parsed[0], parsed[1], parsed[2], parsed[3], parsed[4]) != text:
+        return OP_OTHER, 0, None, text, 0
+    return parsed
+
+
+class Entry:
+    """One ledger row, built on demand from the columns."""
+    __slots__ = ("op", "cents", "counterparty", "note", "timestamp")
+
+    def __init__(self, op, cents=0, counterparty=None, note=None, timestamp=0):
+        self.op = op
+        self.cents = cents
+        self.counterparty = counterparty
+        self.note = note
+        self.timestamp = timestamp
+
+    @property
+    def amount(self):
+        return self.cents / 100
+
+    @property
+    def kind(self):
+        return OP_NAMES.get(self.op, "other")
+
+    def __str__(self):
+        return format_entry(self.op, self.cents, self.counterparty, self.note, self.timestamp)
+
+    def __repr__(self):
+        return f"Entry({self.kind}, {format_cents(self.cents)}, {self.counterparty!r}, {self.note!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Entry):
+            return NotImplemented
+        return (self.op, self.cents, self.counterparty, self.note, self.timestamp) == \
+            (other.op, other.cents, other.counterparty, other.note, other.timestamp)
+
+
+class _Interned:
+    """Append-only string table: each distinct string is stored once."""
+    __slots__ = ("values", "ids")
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def get(self, i):
+        return None if i < 0 else self.values[i]
+
+
+class Ledger:
+    """
+    Transactions stored column-wise. Indexing gives Entry objects, to_strings()
+    gives back the original history strings.
+    """
+    __slots__ = ("ops", "cents", "timestamps", "counterparty", "notes", "_names", "_notes")
+
+    def __init__(self):
+        self.ops = array("B")
+        self.cents = array("q")
+        self.timestamps = array("q")
+        self.counterparty = array("i")
+        self.notes = array("i")
+        self._names = _Interned()
+        self._notes = _Interned()
+
+    @classmethod
+    def from_strings(cls, history):
+        ledger = cls()
+        for text in history:
+            ledger.append_text(text)
+        return ledger
+
+    def append(self, op, cents=0, counterparty=None, note=None, timestamp=0):
+        self.ops.append(op)
+        self.cents.append(cents)
+        self.timestamps.append(timestamp)
+        self.counterparty.append(self._names.intern(counterparty))
+        self.notes.append(self._notes.intern(note))
+
+    def append_text(self, text):
+        self.append(*parse_entry(text))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return Entry(self.ops[i], self.cents[i], self._names.get(self.counterparty[i]),
+                     self._notes.get(self.notes[i]), self.timestamps[i])
+
+    def __iter__(self):
+        for i in range(len(self.ops)):
+            yield self[i]
+
+    def text(self, i):
+        """History string of entry i."""
+        return format_entry(self.ops[i], self.cents[i], self._names.get(self.counterparty[i]),
+                            self._notes.get(self.notes[i]), self.timestamps[i])
+
+    def to_strings(self):
+        for i in range(len(self.ops)):
+            yield self.text(i)
+
+    def total(self, op=None, counterparty=None):
+        """Sum of amounts in cents, optionally only for one operation and/or counterparty."""
+        if op is None and counterparty is None:
+            return sum(self.cents)
+        ops, cents = self.ops, self.cents
+        if counterparty is None:
+            return sum(c for o, c in zip(ops, cents) if o == op)
+        who = self._names.ids.get(counterparty)
+        if who is None:
+            return 0
+        return sum(c for o, c, p in zip(ops, cents, self.counterparty)
+                   if p == who and (op is None or o == op))
+
+    def net(self):
+        """Deposits minus withdrawals and outgoing transfers, in cents."""
+        out = 0
+        for o, c in zip(self.ops, self.cents):
+            if o == OP_DEPOSIT:
+                out += c
+            elif o == OP_WITHDRAW or o == OP_TRANSFER:
+                out -= c
+        return out
+
+    def select(self, op=None, counterparty=None, min_cents=None, max_cents=None):
+        """Indices of entries matching every given filter."""
+        who = None
+        if counterparty is not None:
+            who = self._names.ids.get(counterparty)
+            if who is None:
+                return []
+        out = []
+        for i, (o, c, p) in enumerate(zip(self.ops, self.cents, self.counterparty)):
+            if op is not None and o != op:
+                continue
+            if who is not None and p != who:
+                continue
+            if min_cents is not None and c < min_cents:
+                continue
+            if max_cents is not None and c > max_cents:
+                continue
+            out.append(i)
+        return out
+
+    def filter(self, **criteria):
+        """Entries matching select(**criteria)."""
+        return [self[i] for i in self.select(**criteria)]
+
+    def counterparties(self):
+        return list(self._names.values)
+
+    def nbytes(self):
+        """Approximate size of the columns and string tables in bytes."""
+        size = sum(col.itemsize * len(col) for col in (self.ops, self.cents, self.timestamps,
+                                                      self.counterparty, self.notes))
+        size += sum(len(v) for v in self._names.values) + sum(len(v) for v in self._notes.values)
+        return size
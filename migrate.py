@@ -0,0 +1,211 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Re-encrypt old account payloads in the current "v1:seed:payload" format.
+         Payloads written with the legacy alphabet (and unversioned payloads in
+         general) make every load try decrypt and then decrypt_old; once a file
+         is migrated its header names the alphabet and loads decrypt once.
+         Files are processed in a process pool; finished files are recorded in
+         a checkpoint so an interrupted run can resume where it stopped.
+         A file is replaced under its account lock, and only if nobody saved
+         it since it was read; one that changed is reported as an error and
+         retried on the next run.
+
+         python migrate.py [directory] [--workers 4] [--legacy-only] [--dry-run]
+                           [--checkpoint migrate_checkpoint.json] [--report out.csv]
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from data import account_header
+from encrypt import Encrypt, header_version, strip_payload
+from shards import account_files
+from storage import FileBackend, RevisionConflict, revision_line, split_revision
+
+COMBINED_FILE = "encrypted_users.txt"
+CHECKPOINT_FILE = "migrate_checkpoint.json"
+# save the checkpoint after this many finished files
+CHECKPOINT_EVERY = 50
+
+
+def find_account_files(directory):
+    """All encrypted*.txt files in directory (every filename variant Data tries) and in its shard directories."""
+    paths = set(glob.glob(os.path.join(directory, "encrypted*.txt")))
+    paths.update(path for _, path in account_files(directory=directory))
+    return sorted(paths)
+
+
+def classify(payload, manager):
+    """
+    Work out what a payload is. Returns (kind, plaintext) where kind is
+    "current" (already tagged), "untagged" (current alphabet, no header),
+    "legacy" (old alphabet) or "unknown". A decode only counts if it starts
+    with a well-formed account header; an untagged payload is decoded with
+    both alphabets and is "unknown" (left alone) unless exactly one fits.
+    """
+    if header_version(payload) is not None:
+        return "current", None
+    plain = manager.decrypt(payload)
+    old = manager.decrypt_old(payload)
+    current_ok = account_header(plain) is not None
+    legacy_ok = account_header(old) is not None
+    if current_ok and not legacy_ok:
+        return "untagged", plain
+    if legacy_ok and not current_ok:
+        return "legacy", old
+    return "unknown", None
+
+
+def reencrypt(payload, manager, legacy_only):
+    """
+    Re-encrypt one payload if it needs it.
+    Returns (kind, new_payload or None when nothing should change).
+    """
+    kind, plain = classify(payload, manager)
+    if kind == "legacy" or (kind == "untagged" and not legacy_only):
+        new_payload = manager.encrypt(plain)
+        if manager.decrypt(new_payload) != plain:
+            raise ValueError("round trip check failed")
+        return kind, new_payload
+    return kind, None
+
+
+def migrate_file(path, legacy_only=False, dry_run=False):
+    """
+    Migrate one account file (or the combined name:payload file).
+    Returns (path, status, message); status is "migrated", "skipped" or "error".
+    """
+    manager = Encrypt()
+    store = FileBackend()
+    try:
+        st = os.stat(path)
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if os.path.basename(path) == COMBINED_FILE:
+            lines = []
+            changed = 0
+            for line in text.splitlines():
+                if ":" in line:
+                    name, payload = line.split(":", 1)
+                    kind, new_payload = reencrypt(strip_payload(payload), manager, legacy_only)
+                    if new_payload is not None:
+                        line = f"{name}:{new_payload}"
+                        changed += 1
+                lines.append(line)
+            if not changed:
+                return path, "skipped", "no lines to migrate"
+            if not dry_run:
+                store.rewrite(path, "\n".join(lines) + "\n", expected_stat=(st.st_size, st.st_mtime_ns))
+            return path, "migrated", f"{changed} lines"
+        revision, payload = split_revision(text.lstrip())
+        kind, new_payload = reencrypt(strip_payload(payload), manager, legacy_only)
+        if new_payload is None:
+            return path, "skipped", kind
+        if not dry_run:
+            # a rewrite is a write: bump the revision so open readers notice
+            store.rewrite(path, revision_line(revision + 1) + new_payload, expected_revision=revision)
+        return path, "migrated", kind
+    except RevisionConflict:
+        return path, "error", "saved by someone else while migrating; run again"
+    except Exception as e:
+        return path, "error", str(e)
+
+
+def _migrate_task(args):
+    return migrate_file(*args)
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("done", {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path, done):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"done": done}, f)
+    os.replace(tmp, path)
+
+
+def migrate_directory(directory=".", workers=None, legacy_only=False, dry_run=False,
+                      checkpoint=CHECKPOINT_FILE, on_result=None):
+    """
+    Migrate every account file under directory. Files already listed in the
+    checkpoint are skipped. Returns the list of (path, status, message).
+    Run it from the directory itself (as main does), so the account locks
+    taken are the ones the app takes.
+    """
+    done = load_checkpoint(checkpoint) if checkpoint else {}
+    paths = [p for p in find_account_files(directory) if p not in done]
+    tasks = [(p, legacy_only, dry_run) for p in paths]
+    results = []
+
+    def record(result):
+        results.append(result)
+        path, status, _ = result
+        # errors stay out of the checkpoint so a resumed run retries them
+        if status != "error":
+            done[path] = status
+        if on_result:
+            on_result(result)
+        if checkpoint and not dry_run and len(results) % CHECKPOINT_EVERY == 0:
+            save_checkpoint(checkpoint, done)
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(_migrate_task, tasks, chunksize=16):
+                record(result)
+    else:
+        for task in tasks:
+            record(_migrate_task(task))
+
+    if checkpoint and not dry_run:
+        save_checkpoint(checkpoint, done)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encrypt legacy account files in the current format.")
+    parser.add_argument("directory", nargs="?", default=".")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--legacy-only", action="store_true",
+                        help="only rewrite legacy-alphabet payloads, leave untagged current ones alone")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    parser.add_argument("--checkpoint", default=None,
+                        help=f"progress file (default: {CHECKPOINT_FILE} inside the directory)")
+    parser.add_argument("--report", help="write per-file results to this CSV file")
+    args = parser.parse_args(argv)
+
+    checkpoint = os.path.abspath(args.checkpoint or os.path.join(args.directory, CHECKPOINT_FILE))
+    report = os.path.abspath(args.report) if args.report else None
+    # work from inside the directory: account locks live in its .locks, as for the app
+    os.chdir(args.directory)
+
+    def show(result):
+        print(f"{result[1]:<9} {result[0]}  {result[2]}")
+
+    results = migrate_directory(".", args.workers, args.legacy_only, args.dry_run,
+                                checkpoint, on_result=show)
+    if report:
+        with open(report, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "status", "message"])
+            writer.writerows(results)
+
+    counts = {}
+    for _, status, _ in results:
+        counts[status] = counts.get(status, 0) + 1
+    print(", ".join(f"{k}: {v}" for k, v in sorted(counts.items())) or "nothing to do")
+    return 1 if counts.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
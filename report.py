@@ -0,0 +1,232 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Bank-wide reports.
+         Decodes every account once and adds up
+             accounts, total balance, total deposits, withdrawals and outgoing
+             transfers (from the columnar ledger, no string parsing per sum),
+             accrued savings interest (Data.compute_savings_interest) and the
+             number of accounts opened per month.
+         The usernames are split into chunks and a process pool loads them
+         (map); every chunk comes back as small partial Totals, which the
+         parent merges (reduce). Only usernames and partial sums cross between
+         processes, so the work spreads over the cores.
+
+         python report.py [--format json|csv] [--output report.json] [--workers 4]
+                          [--backend file|sqlite] [--db accounts.db]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ledger import OP_DEPOSIT, OP_TRANSFER, OP_WITHDRAW
+
+# chunks per worker: enough to even out slow chunks, few enough to keep the reduce trivial
+CHUNKS_PER_WORKER = 4
+UNKNOWN_MONTH = "unknown"
+
+# per-process state for pool workers
+_store = None
+_store_spec = None
+
+
+def _get_store(spec):
+    """The storage backend for spec, one per process."""
+    global _store, _store_spec
+    if _store is None or _store_spec != spec:
+        # imported here so the parent only needs them when running in-process
+        from storage import FileBackend, SQLiteBackend
+        kind, target = spec
+        _store = SQLiteBackend(target) if kind == "sqlite" else FileBackend(target)
+        _store_spec = spec
+    return _store
+
+
+class Totals:
+    """
+    Partial sums over some accounts.
+    add(account) counts one loaded Data; merge(other) folds another Totals in.
+    """
+    def __init__(self):
+        self.accounts = 0
+        self.unreadable = 0
+        self.balance_cents = 0
+        self.deposit_cents = 0
+        self.withdraw_cents = 0
+        self.transfer_cents = 0
+        self.interest = 0.0
+        self.opened_per_month = {}
+
+    def add(self, account):
+        sums = {OP_DEPOSIT: 0, OP_WITHDRAW: 0, OP_TRANSFER: 0}
+        ledger = account.ledger()
+        for op, cents in zip(ledger.ops, ledger.cents):
+            if op in sums:
+                sums[op] += cents
+        self.accounts += 1
+        self.balance_cents += round(account.balance * 100)
+        self.deposit_cents += sums[OP_DEPOSIT]
+        self.withdraw_cents += sums[OP_WITHDRAW]
+        self.transfer_cents += sums[OP_TRANSFER]
+        self.interest += account.compute_savings_interest()
+        month = (account.date_opened or "")[:7] or UNKNOWN_MONTH
+        self.opened_per_month[month] = self.opened_per_month.get(month, 0) + 1
+
+    def merge(self, other):
+        self.accounts += other.accounts
+        self.unreadable += other.unreadable
+        self.balance_cents += other.balance_cents
+        self.deposit_cents += other.deposit_cents
+        self.withdraw_cents += other.withdraw_cents
+        self.transfer_cents += other.transfer_cents
+        self.interest += other.interest
+        for month, count in other.opened_per_month.items():
+            self.opened_per_month[month] = self.opened_per_month.get(month, 0) + count
+        return self
+
+    def to_dict(self):
+        return {
+            "accounts": self.accounts,
+            "unreadable": self.unreadable,
+            "total_balance": self.balance_cents / 100,
+            "total_deposits": self.deposit_cents / 100,
+            "total_withdrawals": self.withdraw_cents / 100,
+            "total_transfers_out": self.transfer_cents / 100,
+            "accrued_interest": round(self.interest, 2),
+            "opened_per_month": dict(sorted(self.opened_per_month.items())),
+        }
+
+
+def discover(spec):
+    """Every stored username: the backend's names, plus accounts only found in the combined file."""
+    store = _get_store(spec)
+    names = list(store.names())
+    if spec[0] != "file":
+        return names
+    from combined import open_sorted
+    from storage import COMBINED_FILE
+    combined = open_sorted(source=COMBINED_FILE)
+    if combined is not None:
+        extra = combined.names()
+    else:
+        extra = []
+        try:
+            with open(COMBINED_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    if ":" in line:
+                        extra.append(line.split(":", 1)[0].strip())
+        except FileNotFoundError:
+            pass
+    seen = set(names)
+    for name in extra:
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def report_chunk(spec, usernames):
+    """Map step: Totals for some accounts (runs in a pool worker)."""
+    from data import Data
+    store = _get_store(spec)
+    template = spec[1] if spec[0] == "file" else "encrypted_{username}.txt"
+    totals = Totals()
+    for username in usernames:
+        # no account cache: every account is read once, keeping it would only cost memory
+        account = Data(username=username, filename_template=template, store=store, cache=False)
+        try:
+            ok = account.pull_data(username)
+        except Exception:
+            ok = False
+        if ok:
+            totals.add(account)
+        else:
+            totals.unreadable += 1
+    return totals
+
+
+def _chunk_task(args):
+    return report_chunk(*args)
+
+
+def split(items, parts):
+    """items in at most parts contiguous, nearly equal slices."""
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    out = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        out.append(items[start:stop])
+        start = stop
+    return [chunk for chunk in out if chunk]
+
+
+def run_report(spec=("file", "encrypted_{username}.txt"), workers=None):
+    """
+    Build the bank-wide report. Returns a dict: "totals" (Totals.to_dict()),
+    plus when it was made and how long it took.
+    """
+    started = time.perf_counter()
+    workers = workers or 1
+    usernames = sorted(discover(spec))
+    tasks = [(spec, chunk) for chunk in split(usernames, workers * CHUNKS_PER_WORKER)]
+    totals = Totals()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(_chunk_task, tasks):
+                totals.merge(partial)
+    else:
+        for task in tasks:
+            totals.merge(_chunk_task(task))
+    return {
+        "as_of": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+        "totals": totals.to_dict(),
+    }
+
+
+def to_csv(report):
+    """The report as CSV text: section,key,value rows."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["section", "key", "value"])
+    for key in ("as_of", "workers", "seconds"):
+        writer.writerow(["meta", key, report[key]])
+    for key, value in report["totals"].items():
+        if key != "opened_per_month":
+            writer.writerow(["totals", key, value])
+    for month, count in report["totals"]["opened_per_month"].items():
+        writer.writerow(["opened_per_month", month, count])
+    return out.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bank-wide totals over every account.")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--output", help="write the report here instead of printing it")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", choices=("file", "sqlite"), default="file")
+    parser.add_argument("--db", default="accounts.db", help="database for --backend sqlite")
+    args = parser.parse_args(argv)
+
+    spec = ("sqlite", args.db) if args.backend == "sqlite" else ("file", "encrypted_{username}.txt")
+    report = run_report(spec, max(1, args.workers))
+    text = to_csv(report) if args.format == "csv" else json.dumps(report, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        print(f"{report['totals']['accounts']} accounts in {report['seconds']} s -> {args.output}")
+    else:
+        sys.stdout.write(text)
+    return 1 if report["totals"]["unreadable"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Single-file account store.
+         Every save appends one record (username, encrypted payload) to an
+         append-only segment file; an in-memory dict maps username ->
+         (offset, length) of its newest payload, so a lookup is one seek and
+         one read. The dict is saved next to the segment as an index file and
+         loaded at start-up (only records written after it are rescanned).
+         It is a storage backend: Data(..., store=SegmentStore()).
+         An account's revision is its newest record's offset, tagged with the
+         compaction generation (offsets restart at every compaction).
+
+         Record layout (little endian): uint16 name length, uint32 payload
+         length, uint32 crc32 of name + payload, name, payload (both utf-8).
+
+         python segstore.py import [directory]   copy encrypted_*.txt files in
+         python segstore.py compact              drop superseded records
+         python segstore.py stats
+"""
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from encrypt import strip_payload
+from shards import account_files
+from storage import KeyValueBackend, check_revisions, split_revision
+
+SEGMENT_FILE = "accounts.seg"
+RECORD = struct.Struct("<HII")
+# revision = generation << GENERATION_SHIFT | payload offset
+GENERATION_SHIFT = 48
+COMBINED_FILE = "encrypted_users.txt"
+
+
+class SegmentStore(KeyValueBackend):
+    """
+    Append-only encrypted account store with a username -> (offset, length) index.
+    get(username) -> payload or None
+    put(username, payload) appends a new record
+    """
+    def __init__(self, path=SEGMENT_FILE, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.index = {}
+        self.generation = 0
+        self._lock = threading.Lock()
+        # "a+b" creates the file; reads use seek, writes always go to the end
+        self._file = open(path, "a+b")
+        self._load_index()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self.save_index()
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, username):
+        return username in self.index
+
+    def names(self):
+        return list(self.index)
+
+    def stamp(self, username):
+        # every put appends a new record at a higher offset (and compact starts a
+        # new generation), so the revision changes on every write
+        entry = self.index.get(username)
+        if entry is None:
+            return None
+        return self.generation << GENERATION_SHIFT | entry[0]
+
+    def revision(self, username):
+        return self.stamp(username) or 0
+
+    def _load_index(self):
+        """Load the saved index, then scan whatever was appended after it."""
+        start = 0
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("segment_size", 0) <= os.path.getsize(self.path):
+                self.index = {name: tuple(entry) for name, entry in saved["entries"].items()}
+                start = saved["segment_size"]
+                self.generation = saved.get("generation", 0)
+        except (FileNotFoundError, ValueError, KeyError):
+            self.index = {}
+        self._scan(start)
+
+    def _scan(self, offset):
+        """Index every complete, crc-valid record from offset to the end of the segment."""
+        f = self._file
+        end = os.path.getsize(self.path)
+        while offset + RECORD.size <= end:
+            f.seek(offset)
+            name_len, payload_len, crc = RECORD.unpack(f.read(RECORD.size))
+            body_end = offset + RECORD.size + name_len + payload_len
+            if body_end > end:
+                break
+            name_raw = f.read(name_len)
+            payload_offset = offset + RECORD.size + name_len
+            # records past the saved index are checked against their crc
+            payload = f.read(payload_len)
+            if zlib.crc32(name_raw + payload) != crc:
+                break
+            self.index[name_raw.decode("utf-8")] = (payload_offset, payload_len)
+            offset = body_end
+        if offset < end:
+            # torn write at the tail (crash mid-append): cut it off
+            f.truncate(offset)
+
+    def save_index(self):
+        """Write the index so the next start-up does not rescan the segment."""
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment_size": os.path.getsize(self.path), "generation": self.generation,
+                       "entries": self.index}, f)
+        os.replace(tmp, self.index_path)
+
+    def get(self, username):
+        """Return the newest payload for username, or None."""
+        entry = self.index.get(username)
+        if entry is None:
+            return None
+        offset, length = entry
+        with self._lock:
+            self._file.seek(offset)
+            raw = self._file.read(length)
+        return raw.decode("utf-8")
+
+    def put(self, username, payload):
+        """Append a record for username; it supersedes any older one."""
+        name_raw = username.encode("utf-8")
+        raw = payload.encode("utf-8")
+        record = RECORD.pack(len(name_raw), len(raw), zlib.crc32(name_raw + raw)) + name_raw + raw
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(record)
+            self._file.flush()
+            self.index[username] = (offset + RECORD.size + len(name_raw), len(raw))
+        return True
+
+    def put_many(self, items, sync=False, expected=None):
+        """
+        Append records for several (username, payload) pairs in one write.
+        With sync=True the segment is fsynced once for the whole group.
+        Returns the new revisions. With expected (one revision or None per pair) nothing is appended and
+        RevisionConflict is raised if any account moved past its revision.
+        """
+        records = []
+        for username, payload in items:
+            name_raw = username.encode("utf-8")
+            raw = payload.encode("utf-8")
+            records.append((username, name_raw, raw))
+        with self._lock:
+            check_revisions(items, expected, self.revision)
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            blob = []
+            for username, name_raw, raw in records:
+                blob.append(RECORD.pack(len(name_raw), len(raw), zlib.crc32(name_raw + raw)) + name_raw + raw)
+            self._file.write(b"".join(blob))
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+            for username, name_raw, raw in records:
+                self.index[username] = (offset + RECORD.size + len(name_raw), len(raw))
+                offset += RECORD.size + len(name_raw) + len(raw)
+            return [self.revision(username) for username, _, _ in records]
+
+    def compact(self):
+        """Rewrite the segment with only the newest record of each account."""
+        tmp = self.path + ".compact"
+        with self._lock:
+            new_index = {}
+            with open(tmp, "wb") as out:
+                for name, (offset, length) in self.index.items():
+                    self._file.seek(offset)
+                    raw = self._file.read(length)
+                    name_raw = name.encode("utf-8")
+                    pos = out.tell()
+                    out.write(RECORD.pack(len(name_raw), len(raw), zlib.crc32(name_raw + raw)) + name_raw + raw)
+                    new_index[name] = (pos + RECORD.size + len(name_raw), length)
+            self._file.close()
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "a+b")
+            self.index = new_index
+            self.generation += 1
+            self.save_index()
+
+    def import_files(self, directory="."):
+        """
+        Copy old per-account files (encrypted_<name>.txt, flat or sharded) and the combined
+        name:payload file into the store. Returns the number of accounts imported.
+        """
+        count = 0
+        for username, path in sorted(account_files(directory=directory)):
+            with open(path, "r", encoding="utf-8") as f:
+                payload = strip_payload(split_revision(f.read().lstrip())[1])
+            if payload:
+                self.put(username, payload)
+                count += 1
+        try:
+            with open(os.path.join(directory, COMBINED_FILE), "r", encoding="utf-8") as f:
+                for line in f:
+                    if ":" not in line:
+                        continue
+                    name, payload = line.split(":", 1)
+                    name, payload = name.strip(), strip_payload(payload)
+                    # a per-account file wins over the combined file, same as Data
+                    if payload and name not in self.index:
+                        self.put(name, payload)
+                        count += 1
+        except FileNotFoundError:
+            pass
+        self.save_index()
+        return count
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("import", "compact", "stats"):
+        print(__doc__)
+        return 2
+    store = SegmentStore()
+    try:
+        if argv[0] == "import":
+            print(f"imported {store.import_files(argv[1] if len(argv) > 1 else '.')} accounts")
+        elif argv[0] == "compact":
+            before = os.path.getsize(store.path)
+            store.compact()
+            print(f"{before} -> {os.path.getsize(store.path)} bytes")
+        else:
+            print(f"{len(store)} accounts, {os.path.getsize(store.path)} bytes")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Account service: one warm process serving many clients.
+         An asyncio server on a local TCP or Unix socket speaks line-delimited
+         JSON. Each request is one line
+             {"id": 7, "op": "deposit", "username": "bob", "password": "..", "amount": 5}
+         and gets one response line with the same id
+             {"id": 7, "ok": true, "result": {"balance": 105.0}}
+             {"id": 7, "ok": false, "error": "Incorrect password."}
+         A client may send any number of requests without waiting (pipelining);
+         responses come back as they finish, matched by id; requests on one
+         connection that touch the same account still run in the order they
+         were sent (a deposit then a withdrawal never swap). Loading, cipher
+         work and saving run in a thread pool, and every request goes through
+         the same backend and account cache. Deposits and withdrawals are
+         optimistic (data.update_account): nothing is locked, and a save that
+         raced another writer, in this process or another, is redone on the
+         fresh account. Tellers and scripts can share one store safely.
+
+         ops: ping, login, balance, deposit, withdraw, transfer, history
+
+         python service.py [--host 127.0.0.1] [--port 8765] [--unix /tmp/bank.sock]
+                           [--backend file|sqlite] [--db accounts.db] [--workers 8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from data import update_account, parse_amount, valid_note
+from storage import FileBackend, SQLiteBackend
+from transfer import TransferEngine
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# longest request/response line (history pages can be large)
+LINE_LIMIT = 4 * 1024 * 1024
+# requests one connection may have in flight at once
+MAX_IN_FLIGHT = 64
+HISTORY_PAGE_MAX = 1000
+
+
+class ServiceError(Exception):
+    """A request that cannot be served; its message goes back to the client."""
+
+
+# stands in for a request line that is not JSON
+_BAD_JSON = object()
+
+
+def request_accounts(request):
+    """The usernames a request touches (its account and a transfer's target)."""
+    if not isinstance(request, dict):
+        return ()
+    names = []
+    for key in ("username", "to"):
+        value = request.get(key)
+        if isinstance(value, str) and value.strip():
+            names.append(value.strip())
+    return tuple(names)
+
+
+class AccountService:
+    """
+    Serves account operations for one backend.
+    dispatch(request) -> response dict; serve_tcp / serve_unix run the socket server.
+    """
+    def __init__(self, store=None, encrypt_manager=None, workers=8):
+        self.engine = TransferEngine(store=store, encrypt_manager=encrypt_manager)
+        self.store = self.engine.store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account-service")
+        self.ops = {
+            "ping": self.op_ping,
+            "login": self.op_login,
+            "balance": self.op_balance,
+            "deposit": self.op_deposit,
+            "withdraw": self.op_withdraw,
+            "transfer": self.op_transfer,
+            "history": self.op_history,
+        }
+
+    # --- operations (blocking, run in the executor) ---
+
+    def _account(self, request):
+        username = str(request.get("username", ""))
+        d = self.engine.load(username) if username else None
+        if d is None:
+            raise ServiceError("Username not found.")
+        if d.password != request.get("password"):
+            raise ServiceError("Incorrect password.")
+        return d
+
+    def _amount(self, request):
+        amount = parse_amount(request.get("amount"))
+        if amount is None:
+            raise ServiceError("Amount must be a number greater than zero.")
+        return amount
+
+    def _note(self, request):
+        note = str(request.get("note", "") or "")
+        if not valid_note(note):
+            raise ServiceError("Note cannot contain ';' or line breaks.")
+        return note
+
+    def op_ping(self, request):
+        return {}
+
+    def op_login(self, request):
+        d = self._account(request)
+        return {"username": d.username, "full_name": d.full_name, "balance": d.balance,
+                "account_number": d.account_number, "date_opened": d.date_opened,
+                "transactions": len(d.transaction_history)}
+
+    def op_balance(self, request):
+        d = self._account(request)
+        return {"balance": d.balance, "savings_balance": d.get_savings_balance()}
+
+    def _change(self, request, method):
+        amount = self._amount(request)
+        note = self._note(request)
+        d = self._account(request)
+        ok, d, _ = update_account(d.username, lambda a: getattr(a, method)(amount, note=note, save=False),
+                                  encrypt_manager=self.engine.manager, filename_template=self.engine.filename_template,
+                                  store=self.store, cache=self.engine.cache)
+        if not ok:
+            if d is not None and method == "withdraw" and amount > d.balance:
+                raise ServiceError("Insufficient funds.")
+            raise ServiceError("Could not save.")
+        return {"balance": d.balance}
+
+    def op_deposit(self, request):
+        return self._change(request, "deposit")
+
+    def op_withdraw(self, request):
+        return self._change(request, "withdraw")
+
+    def op_transfer(self, request):
+        amount = self._amount(request)
+        d = self._account(request)
+        target = str(request.get("to", "")).strip()
+        if not target:
+            raise ServiceError("Target account cannot be empty.")
+        note = self._note(request)
+        ok, message = self.engine.transfer(d.username, target, amount, note=note,
+                                           note_target=f"Received from {d.username}" + (f" - {note}" if note else ""))
+        if not ok:
+            raise ServiceError(message)
+        d = self.engine.load(d.username)
+        return {"balance": d.balance, "message": message}
+
+    def op_history(self, request):
+        d = self._account(request)
+        try:
+            offset = max(0, int(request.get("offset", 0)))
+            limit = min(HISTORY_PAGE_MAX, max(0, int(request.get("limit", 50))))
+        except (TypeError, ValueError):
+            raise ServiceError("offset and limit must be integers.")
+        history = d.transaction_history
+        newest_first = bool(request.get("newest_first", True))
+        if hasattr(history, "page"):
+            entries = history.page(offset, limit, newest_first=newest_first)
+        else:
+            entries = list(reversed(history)) if newest_first else list(history)
+            entries = entries[offset:offset + limit]
+        return {"total": len(history), "offset": offset, "entries": entries}
+
+    def dispatch(self, request):
+        """Run one request (blocking). Returns the response dict; never raises."""
+        rid = request.get("id") if isinstance(request, dict) else None
+        if not isinstance(request, dict):
+            return {"id": rid, "ok": False, "error": "Request must be a JSON object."}
+        try:
+            name = request.get("op")
+            op = self.ops.get(name) if isinstance(name, str) else None
+            if op is None:
+                return {"id": rid, "ok": False, "error": f"Unknown op {name!r}."}
+            return {"id": rid, "ok": True, "result": op(request)}
+        except ServiceError as e:
+            return {"id": rid, "ok": False, "error": str(e)}
+        except Exception as e:
+            return {"id": rid, "ok": False, "error": f"Internal error: {e}"}
+
+    # --- socket server ---
+
+    async def handle(self, reader, writer):
+        """
+        Serve one connection; requests run concurrently and responses are
+        written as they finish, except that requests touching the same account
+        run one after another in the order they arrived.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        # username -> the latest request on this connection that touches it
+        latest = {}
+
+        async def run(request, after):
+            try:
+                if after:
+                    await asyncio.wait(after)
+                if request is _BAD_JSON:
+                    response = {"id": None, "ok": False, "error": "Bad JSON."}
+                else:
+                    try:
+                        response = await loop.run_in_executor(self.executor, self.dispatch, request)
+                    except Exception as e:
+                        response = {"id": request.get("id") if isinstance(request, dict) else None,
+                                    "ok": False, "error": f"Internal error: {e}"}
+                data = (json.dumps(response, separators=(",", ":")) + "\n").encode("utf-8")
+                async with write_lock:
+                    writer.write(data)
+                    await writer.drain()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            finally:
+                in_flight.release()
+
+        def forget(task, names):
+            for name in names:
+                if latest.get(name) is task:
+                    del latest[name]
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = _BAD_JSON
+                names = request_accounts(request)
+                after = {latest[name] for name in names if name in latest}
+                await in_flight.acquire()
+                task = asyncio.ensure_future(run(request, after))
+                for name in names:
+                    latest[name] = task
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda t, names=names: forget(t, names))
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def serve_tcp(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+    async def serve_unix(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        return await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+async def _serve(service, args):
+    if args.unix:
+        server = await service.serve_unix(args.unix)
+        where = args.unix
+    else:
+        server = await service.serve_tcp(args.host, args.port)
+        where = ", ".join(str(s.getsockname()) for s in server.sockets)
+    print(f"account service listening on {where}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve account operations over a local socket.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--backend", choices=("file", "sqlite"), default="file")
+    parser.add_argument("--db", default="accounts.db", help="database for --backend sqlite")
+    parser.add_argument("--workers", type=int, default=8, help="threads for file and cipher work")
+    args = parser.parse_args(argv)
+
+    store = SQLiteBackend(args.db) if args.backend == "sqlite" else FileBackend()
+    service = AccountService(store=store, workers=args.workers)
+    try:
+        asyncio.run(_serve(service, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Hash-sharded account directories.
+         With every encrypted_<username>.txt flat in one directory, listing it
+         and every create/rename in it get slow past a few hundred thousand
+         accounts, and backup tools choke on it. The sharded layout puts each
+         file under subdirectories named after the leading hex digits of
+         md5(username), so every directory stays small:
+
+             accounts/3f/a2/encrypted_bob.txt        levels=2, width=2
+
+         The layout in use is the shard map, shards.json in the data directory:
+             {"template": "accounts/{shard}/encrypted_{username}.txt",
+              "levels": 2, "width": 2,
+              "flat_template": "encrypted_{username}.txt", "previous": null}
+         storage.FileBackend resolves every path through it: a filename_template
+         with "{shard}" gets the shard filled in, and the flat template the
+         files were moved from maps to the sharded one, so a plain Data(...)
+         follows the files after a reshard. While a reshard runs, "previous"
+         is the old layout and lookups try both.
+
+         python shards.py reshard [directory] [--root accounts] [--levels 2] [--width 2]
+                                  [--workers 8] [--dry-run]      (--levels 0: back to flat)
+         python shards.py stats [directory]
+         python shards.py where <username> [directory]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SHARD_MAP_FILE = "shards.json"
+FLAT_TEMPLATE = "encrypted_{username}.txt"
+DEFAULT_ROOT = "accounts"
+DEFAULT_LEVELS = 2
+DEFAULT_WIDTH = 2
+SHARDED_TEMPLATE = DEFAULT_ROOT + "/{shard}/" + FLAT_TEMPLATE
+COMBINED_FILE = "encrypted_users.txt"
+RECHECK_INTERVAL = 1.0
+
+
+def shard_of(username, levels=DEFAULT_LEVELS, width=DEFAULT_WIDTH):
+    """The shard directory of username: "3f/a2" for levels=2, width=2."""
+    digest = hashlib.md5(username.encode("utf-8")).hexdigest()
+    return "/".join(digest[i * width:(i + 1) * width] for i in range(levels))
+
+
+class Layout:
+    """
+    One way of naming account files.
+    filename(username) -> path; iter_files(directory) -> (username, path) of every file in it
+    """
+    def __init__(self, template, levels=DEFAULT_LEVELS, width=DEFAULT_WIDTH):
+        self.template = template
+        self.sharded = "{shard}" in template
+        self.levels = levels if self.sharded else 0
+        self.width = width
+
+    def __eq__(self, other):
+        return isinstance(other, Layout) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(self.template)
+
+    def to_dict(self):
+        return {"template": self.template, "levels": self.levels, "width": self.width}
+
+    def filename(self, username):
+        if not self.sharded:
+            return self.template.format(username=username)
+        return self.template.format(username=username, shard=shard_of(username, self.levels, self.width))
+
+    def iter_files(self, directory="."):
+        """Every account file stored in this layout under directory."""
+        if self.sharded:
+            top, _, rest = self.template.partition("{shard}")
+            folders = [os.path.join(directory, top)]
+            for _ in range(self.levels):
+                folders = [entry.path for folder in folders for entry in _scan(folder)
+                           if entry.is_dir() and len(entry.name) == self.width]
+            basename = rest.lstrip("/\\")
+        else:
+            folders = [os.path.join(directory, os.path.dirname(self.template))]
+            basename = os.path.basename(self.template)
+        prefix, _, suffix = basename.partition("{username}")
+        for folder in folders:
+            for entry in _scan(folder):
+                name = entry.name
+                if (name.startswith(prefix) and name.endswith(suffix) and name != COMBINED_FILE
+                        and len(name) > len(prefix) + len(suffix)):
+                    yield name[len(prefix):len(name) - len(suffix)], entry.path
+
+
+def _scan(folder):
+    try:
+        with os.scandir(folder or ".") as entries:
+            return list(entries)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+class ShardMap:
+    """The layout account files are in (plus the one being moved away from)."""
+    def __init__(self, layout, flat_template=FLAT_TEMPLATE, previous=None):
+        self.layout = layout
+        self.flat_template = flat_template
+        self.previous = previous
+
+    @classmethod
+    def from_dict(cls, data):
+        previous = data.get("previous")
+        return cls(Layout(data["template"], data.get("levels", DEFAULT_LEVELS), data.get("width", DEFAULT_WIDTH)),
+                   data.get("flat_template", FLAT_TEMPLATE),
+                   Layout(previous["template"], previous.get("levels", 0), previous.get("width", DEFAULT_WIDTH))
+                   if previous else None)
+
+    def to_dict(self):
+        data = self.layout.to_dict()
+        data["flat_template"] = self.flat_template
+        data["previous"] = self.previous.to_dict() if self.previous else None
+        return data
+
+
+def load_map(path=SHARD_MAP_FILE):
+    """The ShardMap saved at path, or None when the directory is flat."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return ShardMap.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def save_map(shard_map, path=SHARD_MAP_FILE):
+    """Write (or, for None, remove) the shard map through a temp file."""
+    if shard_map is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    else:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(shard_map.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+    _maps.pop((os.getcwd(), path), None)
+
+
+# (cwd, path) -> (ShardMap or None, mtime, checked at), re-read at most once per RECHECK_INTERVAL
+_maps = {}
+_maps_lock = threading.Lock()
+_layouts = {}
+
+
+def get_shard_map(path=SHARD_MAP_FILE):
+    """The shard map of the current directory (cached), or None."""
+    key = (os.getcwd(), path)
+    now = time.monotonic()
+    cached = _maps.get(key)
+    if cached is not None and now - cached[2] < RECHECK_INTERVAL:
+        return cached[0]
+    with _maps_lock:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if cached is not None and cached[1] == mtime:
+            shard_map = cached[0]
+        else:
+            shard_map = load_map(path) if mtime is not None else None
+        _maps[key] = (shard_map, mtime, now)
+        return shard_map
+
+
+def current_layout(template):
+    """The layout files named by template are in right now (through the shard map)."""
+    shard_map = get_shard_map()
+    if shard_map is not None and template in (shard_map.flat_template, shard_map.layout.template):
+        return shard_map.layout
+    layout = _layouts.get(template)
+    if layout is None:
+        layout = _layouts[template] = Layout(template)
+    return layout
+
+
+def previous_layout(template):
+    """The layout a running reshard is moving template's files out of, or None."""
+    shard_map = get_shard_map()
+    if shard_map is not None and template in (shard_map.flat_template, shard_map.layout.template):
+        return shard_map.previous
+    return None
+
+
+def account_files(template=FLAT_TEMPLATE, directory=".", unique=True):
+    """
+    (username, path) of every account file: the current layout first, then a
+    reshard's previous layout and the flat one; each username once unless
+    unique=False.
+    """
+    shard_map = load_map(os.path.join(directory, SHARD_MAP_FILE))
+    layouts = [Layout(template)]
+    if shard_map is not None and template in (shard_map.flat_template, shard_map.layout.template):
+        layouts = [shard_map.layout, shard_map.previous, Layout(shard_map.flat_template)]
+    seen = set()
+    done = []
+    for layout in layouts:
+        if layout is None or layout in done:
+            continue
+        done.append(layout)
+        for username, path in layout.iter_files(directory):
+            if not unique or username not in seen:
+                seen.add(username)
+                yield username, path
+
+
+def reshard(levels=DEFAULT_LEVELS, width=DEFAULT_WIDTH, root=DEFAULT_ROOT, flat_template=FLAT_TEMPLATE,
+            workers=8, dry_run=False, on_result=None):
+    """
+    Move every account file of the current directory into the layout given
+    by levels/width (levels=0: flat). The shard map names the new layout
+    first, with the old one as "previous", so lookups keep finding accounts
+    that have not moved yet; files move in a thread pool, each under its
+    account lock. Returns the list of (username, source, target, status).
+    Re-running after an interruption finishes the job.
+    """
+    from storage import FileBackend
+
+    old = load_map()
+    if old is not None:
+        flat_template = old.flat_template
+    old_layout = old.layout if old is not None else Layout(flat_template)
+    if levels > 0:
+        target = Layout(f"{root}/{{shard}}/{os.path.basename(flat_template)}", levels, width)
+    else:
+        target = Layout(flat_template)
+    # every copy, so an account left in two layouts is reported rather than skipped
+    sources = list(account_files(flat_template, unique=False))
+    if not dry_run:
+        save_map(ShardMap(target, flat_template, old_layout if old_layout != target else None))
+        # give every process time to pick up the new map before its files start moving
+        time.sleep(RECHECK_INTERVAL)
+    backend = FileBackend(flat_template)
+
+    def move(item):
+        username, source = item
+        destination = target.filename(username)
+        if os.path.normpath(source) == os.path.normpath(destination):
+            return username, source, destination, "in place"
+        if dry_run:
+            return username, source, destination, "would move"
+        return username, source, destination, backend.move(source, destination)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for result in pool.map(move, sources):
+            results.append(result)
+            if on_result:
+                on_result(result)
+    # drop the directories the old layout left empty (after the moves, so none races a makedirs)
+    for folder in sorted({os.path.dirname(source) for _, source, _, status in results if status == "moved"},
+                         key=len, reverse=True):
+        if folder:
+            try:
+                os.removedirs(folder)
+            except OSError:
+                pass
+    # an account with a file in both layouts keeps both searched until it is sorted out by hand
+    if not dry_run and not any(status == "exists" for _, _, _, status in results):
+        save_map(ShardMap(target, flat_template) if target.sharded else None)
+    return results
+
+
+def stats(template=FLAT_TEMPLATE):
+    """Accounts and directories in the current layout, and the fullest directory."""
+    per_folder = {}
+    for _, path in account_files(template):
+        folder = os.path.dirname(path)
+        per_folder[folder] = per_folder.get(folder, 0) + 1
+    accounts = sum(per_folder.values())
+    return {
+        "layout": current_layout(template).to_dict(),
+        "accounts": accounts,
+        "directories": len(per_folder),
+        "max_per_directory": max(per_folder.values(), default=0),
+        "mean_per_directory": accounts / len(per_folder) if per_folder else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hash-sharded account directories.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("reshard", help="move account files into a (new) sharded layout")
+    p.add_argument("directory", nargs="?", default=".")
+    p.add_argument("--root", default=DEFAULT_ROOT, help="top directory of the shards")
+    p.add_argument("--levels", type=int, default=DEFAULT_LEVELS, help="directory levels (0: flat)")
+    p.add_argument("--width", type=int, default=DEFAULT_WIDTH, help="hex digits per level")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--dry-run", action="store_true", help="report what would move, move nothing")
+    p = sub.add_parser("stats", help="accounts per directory")
+    p.add_argument("directory", nargs="?", default=".")
+    p = sub.add_parser("where", help="where an account's file goes")
+    p.add_argument("username")
+    p.add_argument("directory", nargs="?", default=".")
+    args = parser.parse_args(argv)
+
+    os.chdir(args.directory)
+    if args.command == "where":
+        path = current_layout(FLAT_TEMPLATE).filename(args.username)
+        print(f"{path}{'' if os.path.exists(path) else '  (missing)'}")
+        return 0
+    if args.command == "stats":
+        for key, value in stats().items():
+            print(f"{key}: {value}")
+        return 0
+
+    counts = {}
+    for _, source, destination, status in reshard(args.levels, args.width, args.root, workers=args.workers,
+                                                 dry_run=args.dry_run):
+        counts[status] = counts.get(status, 0) + 1
+        if status not in ("moved", "in place", "would move"):
+            print(f"{status:<9} {source} -> {destination}")
+    print(", ".join(f"{k}: {v}" for k, v in sorted(counts.items())) or "nothing to do")
+    return 1 if counts.get("exists") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,834 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Storage backends for Data.
+         A backend keeps one encrypted payload per username; Data does the
+         encryption, parsing and validation and hands the backend ciphertext.
+         Pick one when building a Data:
+
+             Data(...)                                   FileBackend (default)
+             Data(..., store=MemoryBackend())            benchmarks and tests
+             Data(..., store=SQLiteBackend("bank.db"))   one indexed database
+             Data(..., store=SegmentStore())             segstore.py
+
+         Every backend provides
+             lookup(username, validate) -> (location, payload, version)
+                 validate(first_chunk) returns the alphabet version or None;
+                 payload is None when the data should be streamed with
+                 open_chunks(location); (None, None, None) if not found
+             open_chunks(location) -> iterator of ciphertext chunks
+             write(username, chunks, location=None, committer=None,
+                   expected_revision=None) -> (location, revision, stamp) or None;
+                 chunks is a function returning an iterator of ciphertext
+                 pieces (called again if a write has to start over, so the
+                 payload is never buffered) or an iterable; revision is the
+                 one just written and stamp its stamp, taken before anyone
+                 else could write (both None when a committer wrote it)
+             write_many([(username, chunks, location, expected_revision), ...])
+                 -> [(location, revision, stamp), ...] or None; all of the
+                 accounts are written or none of them (WritePending:
+                 committed, but only recover() will finish writing the files)
+             revision(location) -> revision number of the stored account, 0 if
+                 there is none; every write stores a higher one
+             names() -> usernames stored
+             stamp(location) -> value that changes on every write (file size
+                 and mtime, or a version number), None if it cannot be told
+             cache_scope -> hashable key for cache.AccountCache
+         FileBackend also keeps the per-account delta logs (append_delta,
+         read_deltas); other backends fall back to full saves.
+
+         Writes given an expected_revision are compare-and-swap: if the stored
+         revision is no longer the expected one (someone saved the account
+         since it was read) nothing is written and RevisionConflict is raised.
+         Account files keep their revision on a first line "#<revision>";
+         files written before revisions existed read as revision 0.
+"""
+import glob
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are kept apart
+    fcntl = None
+
+from combined import open_sorted
+from dirindex import get_index
+from encrypt import iter_file_chunks, strip_payload
+from shards import account_files, current_layout, get_shard_map, previous_layout
+
+COMBINED_FILE = "encrypted_users.txt"
+DELTA_SUFFIX = ".log"
+JOURNAL_SUFFIX = ".journal"
+SQLITE_FILE = "accounts.db"
+LOCK_SUFFIX = ".lock"
+# flock files, one per account file, kept out of the account directories
+LOCK_DIR = ".locks"
+REVISION_MARKER = "#"
+
+
+class RevisionConflict(Exception):
+    """The account was saved by someone else since it was read."""
+
+
+class WritePending(Exception):
+    """
+    A write_many was committed to its journal but not applied to every
+    account file; recover() finishes it (nothing needs to be redone).
+    """
+
+# one lock per account file, shared by every Data in this process
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _lock_for(fname):
+    with _file_locks_guard:
+        lock = _file_locks.get(fname)
+        if lock is None:
+            lock = _file_locks[fname] = threading.RLock()
+        return lock
+
+
+def _lock_path(fname):
+    """The flock file of an account file: .locks/<md5 of its absolute path>.lock."""
+    digest = hashlib.md5(os.path.abspath(fname).encode("utf-8")).hexdigest()
+    return os.path.join(LOCK_DIR, digest + LOCK_SUFFIX)
+
+
+@contextmanager
+def _locked(fname):
+    """
+    Hold fname against other threads and, through an flock on its file in
+    .locks, against other processes. Only the check-and-write runs under it.
+    """
+    with _lock_for(fname):
+        if fcntl is None:
+            yield
+            return
+        path = _lock_path(fname)
+        try:
+            try:
+                handle = open(path, "a")
+            except FileNotFoundError:
+                os.makedirs(LOCK_DIR, exist_ok=True)
+                handle = open(path, "a")
+        except OSError:
+            # no lock file (read-only directory): the write will fail anyway
+            yield
+            return
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            handle.close()
+
+
+def split_revision(text):
+    """
+    Split the "#<revision>" line off the start of an account file.
+    Returns (revision, rest); text without the line is revision 0.
+    """
+    if not text.startswith(REVISION_MARKER):
+        return 0, text
+    line, _, rest = text.partition("\n")
+    try:
+        return int(line[len(REVISION_MARKER):]), rest
+    except ValueError:
+        return 0, text
+
+
+def revision_line(revision):
+    return f"{REVISION_MARKER}{revision}\n"
+
+
+_journal_counter = iter(range(1, 1 << 62))
+_journal_counter_lock = threading.Lock()
+# journals this process is still writing; recover() leaves them alone
+_active_journals = set()
+
+
+def _process_alive(pid):
+    """Whether process pid is still running."""
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _journal_orphaned(journal):
+    """
+    True if nobody is writing journal ("transfer_<pid>_<n>.journal") any more:
+    its process is gone, or it is this process's and no write_many holds it.
+    """
+    parts = os.path.basename(journal)[:-len(JOURNAL_SUFFIX)].split("_")
+    try:
+        pid = int(parts[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        with _journal_counter_lock:
+            return journal not in _active_journals
+    return not _process_alive(pid)
+
+
+def fresh_chunks(chunks):
+    """A new iterator over write()'s chunks argument (a function returning one, or an iterable)."""
+    return chunks() if callable(chunks) else iter(chunks)
+
+
+def _replace_file(fname, payload):
+    """Write payload to fname through a synced temp file."""
+    tmp = fname + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fname)
+
+
+class FileBackend:
+    """
+    The original layout: one "encrypted_<username>.txt" file per account in
+    the current directory (plus the older filename variants and the combined
+    "username:payload" file, which are still read; through combined.py's
+    sorted copy when it is up to date). Once the directory is resharded, or
+    with a "{shard}" template, the files sit in hash-prefix subdirectories
+    (shards.py).
+    """
+    def __init__(self, filename_template="encrypted_{username}.txt"):
+        self.filename_template = filename_template
+        # the directory (current when the backend is made) and its index, looked up once
+        self.directory = os.getcwd()
+        self.index = get_index(self.directory)
+
+    @property
+    def cache_scope(self):
+        # every FileBackend on the same directory and template sees the same files
+        return "file", self.directory, self.filename_template
+
+    def stamp(self, location):
+        """(size, mtime) of the account file and of its delta log."""
+        try:
+            st = os.stat(location)
+        except OSError:
+            return None
+        try:
+            log = os.stat(self.delta_filename(location))
+            log_stamp = (log.st_size, log.st_mtime_ns)
+        except OSError:
+            log_stamp = None
+        return st.st_size, st.st_mtime_ns, log_stamp
+
+    def filename(self, username):
+        """Where username's file goes, through the shard map (shards.py)."""
+        return current_layout(self.filename_template).filename(username)
+
+    def possible_filenames(self, username):
+        """Common filename variants to try; with a sharded layout its path (and a running reshard's old one) first."""
+        sharded, variants = self._candidates(username)
+        return sharded + variants
+
+    def _candidates(self, username):
+        """(paths in shard directories, flat variants): the first are opened directly, the others checked in the index."""
+        variants = [
+            f"encrypted_{username}.txt",
+            f"encrypted {username}.txt",
+            f"encrypted{username}.txt",
+            f"encrypted-{username}.txt",
+        ]
+        layout = current_layout(self.filename_template)
+        previous = previous_layout(self.filename_template)
+        # a running reshard's old layout: accounts it has not moved yet are still there
+        moving = [previous.filename(username)] if previous is not None else []
+        if not layout.sharded:
+            return moving, variants + [layout.filename(username)]
+        return [layout.filename(username)] + moving, variants
+
+    def lookup(self, username, validate):
+        """
+        Find where username is stored without reading whole files.
+        Only the first chunk of a per-account file is read and validated; a
+        hit in the combined file returns its payload.
+        """
+        # try variants that exist (per the directory index, no failed opens); the
+        # index only lists the top directory, so shard paths are simply opened
+        index = self.index
+        for attempt in range(2):
+            sharded, variants = self._candidates(username)
+            for fname in sharded + index.existing(variants):
+                try:
+                    first = next(self.open_chunks(fname), "")
+                    if not first:
+                        continue
+                    version = validate(first)
+                    if version is not None:
+                        return fname, None, version
+                except FileNotFoundError:
+                    continue
+                except Exception:
+                    continue
+            # while a reshard runs the file can move from a path not tried yet to one
+            # already tried; one more pass finds it (each file moves once)
+            if previous_layout(self.filename_template) is None:
+                break
+
+        # fallback combined file: the sorted, mapped copy answers with a binary search
+        combined = open_sorted(source=COMBINED_FILE)
+        if combined is not None:
+            for payload in combined.payloads(username):
+                version = validate(payload)
+                if version is not None:
+                    return COMBINED_FILE, payload, version
+            return None, None, None
+        if not index.exists(COMBINED_FILE):
+            return None, None, None
+        try:
+            with open(COMBINED_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if ':' not in line:
+                        continue
+                    name, payload = line.split(':', 1)
+                    if name.strip() != username:
+                        continue
+                    payload = strip_payload(payload)
+                    if not payload:
+                        continue
+                    version = validate(payload)
+                    if version is not None:
+                        return COMBINED_FILE, payload, version
+        except FileNotFoundError:
+            pass
+        except Exception:
+            pass
+        return None, None, None
+
+    def open_chunks(self, location):
+        """Ciphertext chunks of the file, without its revision line."""
+        with open(location, "r", encoding="utf-8") as f:
+            chunks = iter_file_chunks(f)
+            first = next(chunks, "")
+            if location != COMBINED_FILE:
+                first = split_revision(first)[1]
+            if first:
+                yield first
+            yield from chunks
+
+    def revision(self, location):
+        """Revision on the first line of the account file; 0 if it has none or is missing."""
+        try:
+            with open(location, "r", encoding="utf-8") as f:
+                head = f.read(32)
+        except OSError:
+            return 0
+        return split_revision(head.lstrip())[0]
+
+    def _write_file(self, fname, chunks, committer):
+        if committer is not None:
+            # the coordinator writes it in the next batch; wait for the commit
+            if not committer.submit(fname, "".join(chunks)):
+                raise OSError(f"could not commit {fname}")
+            return
+        # through a temp file, so a reader racing the save sees the old file or the new one
+        tmp = fname + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for piece in chunks:
+                    f.write(piece)
+            os.replace(tmp, fname)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def write(self, username, chunks, location=None, committer=None, expected_revision=None):
+        """
+        Write the account, preferring the file it was loaded from so we don't
+        create duplicate files. Returns (filename actually written, revision).
+        Raises RevisionConflict if expected_revision is given and the file has
+        moved past it.
+        """
+        canonical = self.filename(username)
+        fname = location or canonical
+        if not callable(chunks):
+            # a one-shot iterable cannot be restarted for the fallback; Data passes a function
+            chunks = list(chunks)
+        # never overwrite the shared file with one account; its own file wins on the next lookup
+        if fname != canonical and fname != COMBINED_FILE:
+            written = self._write_locked(username, fname, chunks, committer, expected_revision, must_exist=True)
+            if written is not None:
+                return written
+            # moved by a reshard since it was loaded: write it where lookups look first
+        self._make_folder(canonical)
+        return self._write_locked(username, canonical, chunks, committer, expected_revision)
+
+    def _make_folder(self, fname):
+        folder = os.path.dirname(fname)
+        if folder and current_layout(self.filename_template).sharded and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def _write_locked(self, username, fname, chunks, committer, expected_revision, must_exist=False):
+        """write() for one path; None if must_exist and the file is gone."""
+        with _locked(fname):
+            if must_exist and not os.path.exists(fname):
+                return None
+            current = self.revision(fname)
+            if expected_revision is not None and current != expected_revision:
+                raise RevisionConflict(f"{username}: revision {current}, expected {expected_revision}")
+            def pieces():
+                # streamed straight into the temp file; a retry encrypts again
+                return itertools.chain([revision_line(current + 1)], fresh_chunks(chunks))
+            # try to write; if path has dirs and write fails, fallback to base name
+            try:
+                self._write_file(fname, pieces(), committer)
+                written = fname
+            except Exception:
+                if "\\" in fname:
+                    written = fname.split("\\")[-1]
+                elif "/" in fname:
+                    written = fname.split("/")[-1]
+                else:
+                    written = fname
+                self._write_file(written, pieces(), committer)
+            self.index.add(written)
+            # the snapshot now holds every delta, so the log can go
+            self.clear_deltas(fname)
+            # still locked: nobody else's write can be in this stamp
+            return written, current + 1, self.stamp(written)
+
+    def write_many(self, items):
+        """
+        Write several accounts all-or-nothing. The new payloads go to a
+        journal file first; the account files are only replaced once the
+        journal is on disk, and recover() finishes a run that was cut short.
+        Returns [(filename, revision, stamp), ...], or None if nothing was changed; raises
+        RevisionConflict (nothing written) if an expected revision is stale, and
+        WritePending if the journal was committed but applying it failed.
+        """
+        pending = []
+        for username, chunks, location, expected in items:
+            fname = location or self.filename(username)
+            if fname == COMBINED_FILE or (fname != self.filename(username) and not os.path.exists(fname)):
+                # the shared file, or a file a reshard moved away: write the account's own path
+                fname = self.filename(username)
+                self._make_folder(fname)
+            pending.append((username, fname, "".join(fresh_chunks(chunks)), expected))
+        with _journal_counter_lock:
+            journal = f"transfer_{os.getpid()}_{next(_journal_counter)}{JOURNAL_SUFFIX}"
+            _active_journals.add(journal)
+        try:
+            with ExitStack() as held:
+                for fname in sorted({fname for _, fname, _, _ in pending}):
+                    held.enter_context(_locked(fname))
+                entries = []
+                revisions = []
+                for username, fname, payload, expected in pending:
+                    current = self.revision(fname)
+                    if expected is not None and current != expected:
+                        raise RevisionConflict(f"{username}: revision {current}, expected {expected}")
+                    entries.append((fname, revision_line(current + 1) + payload))
+                    revisions.append(current + 1)
+                try:
+                    _replace_file(journal, json.dumps(entries))
+                except Exception:
+                    for leftover in (journal, journal + ".tmp"):
+                        try:
+                            os.remove(leftover)
+                        except OSError:
+                            pass
+                    return None
+                # from here on the write is committed: it is finished or left for recover(), never undone
+                try:
+                    self._apply_journal(entries)
+                except Exception as e:
+                    raise WritePending(f"{journal}: committed, not applied yet ({e})")
+                try:
+                    os.remove(journal)
+                except OSError:
+                    # every file is written; a replay would skip them by revision
+                    pass
+                written = [(fname, revision, self.stamp(fname)) for (fname, _), revision in zip(entries, revisions)]
+        finally:
+            with _journal_counter_lock:
+                _active_journals.discard(journal)
+        return written
+
+    def _apply_journal(self, entries):
+        for fname, payload in entries:
+            _replace_file(fname, payload)
+            self.index.add(fname)
+            self.clear_deltas(fname)
+
+    def _replay_journal(self, entries):
+        """
+        Apply a journal left behind, under the same locks and in the same order
+        as write_many; a file already at (or past) the journal's revision was
+        written by it or saved since, and is left as it is.
+        """
+        with ExitStack() as held:
+            for fname in sorted({fname for fname, _ in entries}):
+                held.enter_context(_locked(fname))
+            for fname, payload in entries:
+                if self.revision(fname) >= split_revision(payload)[0]:
+                    continue
+                _replace_file(fname, payload)
+                self.index.add(fname)
+                self.clear_deltas(fname)
+
+    def recover(self):
+        """
+        Finish multi-account writes cut short (by a crash, or by an error after
+        the commit). Only journals whose writer is gone are replayed. Returns
+        how many were.
+        """
+        replayed = 0
+        for journal in glob.glob("transfer_*" + JOURNAL_SUFFIX):
+            if not _journal_orphaned(journal):
+                continue
+            try:
+                with open(journal, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+                self._replay_journal(entries)
+                os.remove(journal)
+                replayed += 1
+            except Exception:
+                continue
+        # journals that never reached their final name were never committed
+        for tmp in glob.glob("transfer_*" + JOURNAL_SUFFIX + ".tmp"):
+            if _journal_orphaned(tmp[:-len(".tmp")]):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        return replayed
+
+    def move(self, source, destination):
+        """
+        Move an account file and its delta log to destination, under the
+        account's lock (shards.py resharding). Returns "moved", "missing" (source
+        is gone) or "exists" (destination is taken, nothing moved).
+        """
+        with _locked(source):
+            if not os.path.exists(source):
+                return "missing"
+            if os.path.exists(destination):
+                return "exists"
+            folder = os.path.dirname(destination)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            # the log first: a crash in between leaves the account where it was, re-run to finish
+            if os.path.exists(self.delta_filename(source)):
+                os.replace(self.delta_filename(source), self.delta_filename(destination))
+            os.replace(source, destination)
+            self.index.discard(source)
+            self.index.add(destination)
+            # writers waiting on it find the file gone and follow it to its new path
+            try:
+                os.remove(_lock_path(source))
+            except OSError:
+                pass
+        return "moved"
+
+    def rewrite(self, location, text, expected_revision=None, expected_stat=None):
+        """
+        Replace a whole file with text (which carries its own revision line),
+        under the account's lock (migrate.py). Raises RevisionConflict if the
+        file's revision is not expected_revision, or its (size, mtime) is not
+        expected_stat (for the combined file, which has no revision).
+        """
+        with _locked(location):
+            if expected_revision is not None and self.revision(location) != expected_revision:
+                raise RevisionConflict(f"{location}: revision moved past {expected_revision}")
+            if expected_stat is not None:
+                try:
+                    st = os.stat(location)
+                except OSError:
+                    st = None
+                if st is None or (st.st_size, st.st_mtime_ns) != expected_stat:
+                    raise RevisionConflict(f"{location}: changed since it was read")
+            self._write_file(location, [text], None)
+
+    def names(self):
+        if current_layout(self.filename_template).sharded or get_shard_map() is not None:
+            return [username for username, _ in account_files(self.filename_template)]
+        prefix, _, suffix = self.filename_template.partition("{username}")
+        return [name[len(prefix):len(name) - len(suffix)] for name in self.index.names()
+                if name.startswith(prefix) and name.endswith(suffix) and name != COMBINED_FILE
+                and len(name) > len(prefix) + len(suffix)]
+
+    def delta_filename(self, location):
+        return location + DELTA_SUFFIX
+
+    def append_delta(self, location, line, expected_revision=None, expected_deltas=None):
+        """
+        Append one delta line. Returns the account's stamp with the line in it
+        (taken under the lock), or False if the account file is gone (moved by
+        a reshard).
+        Raises RevisionConflict if expected_revision is given and the file has
+        moved past it, or expected_deltas is given and the log does not hold
+        exactly that many lines (someone else appended since it was read).
+        """
+        with _locked(location):
+            if not os.path.exists(location):
+                return False
+            if expected_revision is not None and self.revision(location) != expected_revision:
+                raise RevisionConflict(f"{location}: revision moved past {expected_revision}")
+            if expected_deltas is not None and len(self.read_deltas(location)) != expected_deltas:
+                raise RevisionConflict(f"{location}: delta log changed since it was read")
+            with open(self.delta_filename(location), "a", encoding="utf-8") as f:
+                f.write(line)
+            return self.stamp(location)
+
+    def read_deltas(self, location):
+        try:
+            with open(self.delta_filename(location), "r", encoding="utf-8") as f:
+                return f.readlines()
+        except FileNotFoundError:
+            return []
+
+    def clear_deltas(self, location):
+        try:
+            os.remove(self.delta_filename(location))
+        except FileNotFoundError:
+            pass
+
+
+class KeyValueBackend:
+    """
+    Base for backends that map username -> payload with get/put.
+    Subclasses provide get(username), put(username, payload), names() and
+    put_many(items, sync=False, expected=None) -> the new revisions, which
+    writes every save (a CommitCoordinator batches through it too) and does
+    the compare-and-swap (expected holds one revision, or None, per item).
+    stamp(username) lets the account cache validate entries and
+    revision(username) numbers the writes; here a stamp is the revision, so
+    a write's stamp comes back with its revision.
+    """
+    @property
+    def cache_scope(self):
+        return self
+
+    def stamp(self, location):
+        return None
+
+    def revision(self, location):
+        return self.stamp(location) or 0
+
+    def lookup(self, username, validate):
+        payload = self.get(username)
+        version = validate(payload) if payload else None
+        if version is None:
+            return None, None, None
+        # Data reads the revision first and then the payload through open_chunks,
+        # so a write in between shows up as a conflict rather than a lost update
+        return username, None, version
+
+    def open_chunks(self, location):
+        payload = self.get(location)
+        return iter([payload] if payload else [])
+
+    def write(self, username, chunks, location=None, committer=None, expected_revision=None):
+        payload = "".join(fresh_chunks(chunks))
+        if committer is not None and expected_revision is None:
+            # batched with other accounts' saves; the revision does not come back
+            return (username, None, None) if committer.submit(username, payload, store=self) else None
+        expected = None if expected_revision is None else [expected_revision]
+        revisions = self.put_many([(username, payload)], expected=expected)
+        return (username, revisions[0], revisions[0]) if revisions else None
+
+    def write_many(self, items):
+        """All-or-nothing through put_many (one transaction or one append)."""
+        pairs = [(username, "".join(fresh_chunks(chunks))) for username, chunks, location, expected in items]
+        expected = [expected for _, _, _, expected in items]
+        try:
+            revisions = self.put_many(pairs, expected=expected if any(e is not None for e in expected) else None)
+        except RevisionConflict:
+            raise
+        except Exception:
+            revisions = None
+        return [(username, revision, revision) for (username, _), revision in zip(pairs, revisions)] if revisions else None
+
+    def close(self):
+        pass
+
+
+def check_revisions(items, expected, current):
+    """Raise RevisionConflict unless every expected revision matches current(username)."""
+    if expected is None:
+        return
+    for (username, _), want in zip(items, expected):
+        if want is not None and current(username) != want:
+            raise RevisionConflict(f"{username}: revision {current(username)}, expected {want}")
+
+
+class MemoryBackend(KeyValueBackend):
+    """Accounts kept in a dict; nothing touches the disk."""
+    def __init__(self):
+        self._payloads = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def __contains__(self, username):
+        return username in self._payloads
+
+    def get(self, username):
+        return self._payloads.get(username)
+
+    def put(self, username, payload):
+        with self._lock:
+            self._payloads[username] = payload
+            self._versions[username] = self._versions.get(username, 0) + 1
+        return True
+
+    def put_many(self, items, sync=False, expected=None):
+        revisions = []
+        with self._lock:
+            check_revisions(items, expected, self.revision)
+            for username, payload in items:
+                self._payloads[username] = payload
+                self._versions[username] = self._versions.get(username, 0) + 1
+                revisions.append(self._versions[username])
+        return revisions
+
+    def stamp(self, location):
+        return self._versions.get(location)
+
+    def names(self):
+        return list(self._payloads)
+
+
+# statements are module constants so every call reuses sqlite3's prepared statement cache
+SQL_CREATE = ("CREATE TABLE IF NOT EXISTS accounts (username TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+              "version INTEGER NOT NULL DEFAULT 1) WITHOUT ROWID")
+SQL_GET = "SELECT payload FROM accounts WHERE username = ?"
+SQL_VERSION = "SELECT version FROM accounts WHERE username = ?"
+SQL_PUT = ("INSERT INTO accounts (username, payload) VALUES (?, ?) "
+           "ON CONFLICT (username) DO UPDATE SET payload = excluded.payload, version = version + 1")
+SQL_INSERT_NEW = "INSERT INTO accounts (username, payload) VALUES (?, ?) ON CONFLICT (username) DO NOTHING"
+SQL_PUT_IF = "UPDATE accounts SET payload = ?, version = version + 1 WHERE username = ? AND version = ?"
+SQL_NAMES = "SELECT username FROM accounts ORDER BY username"
+SQL_COUNT = "SELECT COUNT(*) FROM accounts"
+
+
+class SQLiteBackend(KeyValueBackend):
+    """
+    Accounts in one sqlite3 database, table accounts(username, payload, version);
+    version goes up by one on every write.
+    The username is the primary key of a WITHOUT ROWID table, so lookups are
+    a single index search. The database runs in WAL mode: readers never block
+    the writer. Each thread gets its own connection.
+    synchronous="NORMAL" syncs at WAL checkpoints; "FULL" syncs every commit.
+    """
+    def __init__(self, path=SQLITE_FILE, synchronous="NORMAL"):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(SQL_CREATE)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; put_many opens its own transaction
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def __len__(self):
+        return self._conn().execute(SQL_COUNT).fetchone()[0]
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def get(self, username):
+        row = self._conn().execute(SQL_GET, (username,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, username, payload):
+        self._conn().execute(SQL_PUT, (username, payload))
+        return True
+
+    def stamp(self, location):
+        row = self._conn().execute(SQL_VERSION, (location,)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items, sync=False, expected=None):
+        """
+        Write several (username, payload) pairs in one transaction; sync=True forces it to disk.
+        Returns the new versions. With expected, a pair whose stored version differs
+        from its expected one (0: not stored yet) rolls the whole transaction back
+        with RevisionConflict.
+        """
+        conn = self._conn()
+        if sync and self.synchronous != "FULL":
+            conn.execute("PRAGMA synchronous=FULL")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if expected is None:
+                    conn.executemany(SQL_PUT, items)
+                else:
+                    for (username, payload), want in zip(items, expected):
+                        if want is None:
+                            conn.execute(SQL_PUT, (username, payload))
+                        elif want == 0:
+                            if conn.execute(SQL_INSERT_NEW, (username, payload)).rowcount != 1:
+                                raise RevisionConflict(f"{username}: already stored, expected a new account")
+                        elif conn.execute(SQL_PUT_IF, (payload, username, want)).rowcount != 1:
+                            raise RevisionConflict(f"{username}: revision moved past {want}")
+                # still inside the write transaction, so nobody else's write can show up here
+                revisions = [conn.execute(SQL_VERSION, (username,)).fetchone()[0] for username, _ in items]
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            if sync and self.synchronous != "FULL":
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return revisions
+
+    def names(self):
+        return [row[0] for row in self._conn().execute(SQL_NAMES)]
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,123 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Background work for the Tk GUI.
+         Loading, decrypting and saving accounts inside a Tk callback freezes
+         the window until the disk is done. TaskRunner runs that work on a
+         small thread pool instead; finished tasks are put on a queue that
+         the Tk thread drains with after() polling (about every frame), so
+         callbacks still run on the Tk thread and may touch widgets. While a
+         task runs, the widgets passed as `disable` are greyed out and a
+         status line with a spinner is shown at the bottom of the window.
+         Work functions must not touch Tk themselves.
+
+             self.tasks.submit(load, on_done=show, disable=[self.login], message="Logging in")
+"""
+import queue
+import time
+import tkinter as tk
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 4
+# ~60 polls per second
+POLL_MS = 16
+SPINNER = "|/-\\"
+
+
+class TaskRunner:
+    """
+    Runs blocking functions off the Tk thread.
+    submit(func, *args, on_done=None, on_error=None, disable=(), message="Working")
+    """
+    def __init__(self, root, workers=DEFAULT_WORKERS, poll_ms=POLL_MS, bg="#fde6a3"):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.bg = bg
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-task")
+        self._done = queue.Queue()
+        self._running = 0
+        self._polling = False
+        self._status = None
+        self._message = ""
+
+    @property
+    def busy(self):
+        return self._running > 0
+
+    def submit(self, func, *args, on_done=None, on_error=None, disable=(), message="Working"):
+        """Run func(*args) on a worker; on_done(result) or on_error(exc) is called on the Tk thread."""
+        disabled = []
+        for widget in disable:
+            if widget is None:
+                continue
+            try:
+                disabled.append((widget, widget.cget("state")))
+                widget.config(state="disabled")
+            except Exception:
+                pass
+        task = (on_done, on_error, disabled)
+        self._running += 1
+        self._message = message
+        self._show_status()
+        future = self._executor.submit(func, *args)
+        # runs on the worker thread: only hand the result over
+        future.add_done_callback(lambda f: self._done.put((task, f)))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return future
+
+    def _poll(self):
+        while True:
+            try:
+                (on_done, on_error, disabled), future = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._running -= 1
+            for widget, state in disabled:
+                try:
+                    widget.config(state=state)
+                except Exception:
+                    # the page was rebuilt while the task ran
+                    pass
+            error = future.exception()
+            try:
+                if error is not None:
+                    if on_error is not None:
+                        on_error(error)
+                    else:
+                        traceback.print_exception(type(error), error, error.__traceback__)
+                elif on_done is not None:
+                    on_done(future.result())
+            except Exception:
+                traceback.print_exc()
+        if self._running > 0:
+            self._show_status()
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+            self._hide_status()
+
+    def _show_status(self):
+        try:
+            if self._status is None or not self._status.winfo_exists():
+                self._status = tk.Label(self.root, bg=self.bg)
+            if not self._status.winfo_ismapped():
+                self._status.pack(side="bottom", fill="x")
+                self.root.config(cursor="watch")
+            frame = SPINNER[int(time.monotonic() * 8) % len(SPINNER)]
+            self._status.config(text=f"{self._message}... {frame}")
+        except Exception:
+            pass
+
+    def _hide_status(self):
+        try:
+            if self._status is not None:
+                self._status.pack_forget()
+            self.root.config(cursor="")
+        except Exception:
+            pass
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,113 @@
+"""
+author : Leo L. and Jeff J.
+date   : dec 2
+desc   : Transfers between accounts.
+         The GUI used to debit the sender, save, then credit the target and
+         save again, with a best-effort refund if the credit failed; two
+         transfers touching the same accounts at once could overwrite each
+         other's balance. TransferEngine locks both accounts (always in
+         username order, so two transfers can never wait on each other),
+         reloads them inside the locks, applies debit and credit in memory
+         and writes both with one all-or-nothing save (a journal for the
+         file backend, one transaction for SQLite). Transfers between
+         different pairs of accounts run in parallel. The locks only cover
+         this process; the save checks the accounts' revisions, so a
+         transfer that raced another process is reloaded and tried again.
+
+             engine = TransferEngine()
+             ok, message = engine.transfer("alice", "bob", 25.0)
+"""
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from data import Data, save_all, parse_amount, valid_note, valid_username, UPDATE_ATTEMPTS, UPDATE_BACKOFF
+from encrypt import Encrypt
+from storage import FileBackend, RevisionConflict, WritePending
+
+# (backend scope, username) -> lock, shared by every engine in this process
+_account_locks = {}
+_account_locks_guard = threading.Lock()
+
+
+def account_lock(store, username):
+    """The process-wide lock for one account on one backend."""
+    key = (store.cache_scope, username)
+    with _account_locks_guard:
+        lock = _account_locks.get(key)
+        if lock is None:
+            lock = _account_locks[key] = threading.Lock()
+        return lock
+
+
+class TransferEngine:
+    """
+    Moves money between accounts of one backend.
+    transfer(from_username, to_username, amount) -> (ok, message)
+    """
+    def __init__(self, store=None, encrypt_manager=None, filename_template="encrypted_{username}.txt", cache=True):
+        self.store = store if store is not None else FileBackend(filename_template)
+        self.manager = encrypt_manager or Encrypt()
+        self.filename_template = filename_template
+        self.cache = cache
+        if hasattr(self.store, "recover"):
+            # finish any transfer a crash left half written
+            self.store.recover()
+
+    def locked(self, *usernames):
+        """Context manager holding the locks of every given account, taken in a fixed order."""
+        stack = ExitStack()
+        for username in sorted(set(usernames)):
+            stack.enter_context(account_lock(self.store, username))
+        return stack
+
+    def load(self, username):
+        """Fresh Data for username, or None if it does not exist."""
+        d = Data(username=username, encrypt_manager=self.manager, filename_template=self.filename_template,
+                 store=self.store, cache=self.cache)
+        return d if d.pull_data(username) else None
+
+    def transfer(self, from_username, to_username, amount, note="", note_target=""):
+        amt = parse_amount(amount)
+        if amt is None:
+            return False, "Amount must be a number greater than zero."
+        if not valid_note(note) or not valid_note(note_target):
+            return False, "Notes cannot contain ';' or line breaks."
+        if not valid_username(to_username):
+            return False, "Target account not found."
+        if from_username == to_username:
+            return False, "Cannot transfer to the same account."
+        with self.locked(from_username, to_username):
+            for attempt in range(UPDATE_ATTEMPTS):
+                sender = self.load(from_username)
+                if sender is None:
+                    return False, "Source account not found."
+                target = self.load(to_username)
+                if target is None:
+                    return False, "Target account not found."
+                if not sender.transfer(to_username, amt, note=note, save=False):
+                    return False, "Insufficient funds."
+                target.deposit(amt, note=note_target, save=False)
+                try:
+                    if not save_all([sender, target], check_revision=True):
+                        return False, "Could not save the transfer; no money was moved."
+                    return True, f"Transferred {amt:.2f} to {to_username}."
+                except WritePending:
+                    # committed: the money moved, only some files still show the old balances
+                    self.store.recover()
+                    return True, f"Transferred {amt:.2f} to {to_username} (finishing the save)."
+                except RevisionConflict:
+                    # another process saved one of the accounts since we loaded it
+                    time.sleep(random.uniform(0, UPDATE_BACKOFF * (1 << min(attempt, 10))))
+        return False, "The accounts kept changing; no money was moved."
+
+    def total_balance(self, usernames):
+        """Sum of the balances of usernames, read under their locks."""
+        with self.locked(*usernames):
+            total = 0.0
+            for username in usernames:
+                d = self.load(username)
+                if d is not None:
+                    total += d.balance
+            return total